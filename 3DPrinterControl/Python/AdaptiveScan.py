@@ -0,0 +1,288 @@
+"""Adaptive scans: a coarse grid first, then extra points only where the measured flow changes between neighbours.
+
+Each scan point is the center of a rectangular cell, as in ScanGrid. After the coarse grid is measured, every pair
+of neighbouring cells whose values (e.g. velocity and total pressure) differ by more than the threshold marks both
+cells for refinement. A refined cell is split into 3 by 3 smaller cells, so its center is kept and only 8 new points
+are measured. Passes repeat until no neighbours differ by more than the threshold, the point budget is spent, or the
+cells reach their minimum size. Freestream regions keep the coarse spacing while wakes and shear layers get the fine
+one.
+
+The measure function gets the (N,3) points of each pass and returns their values. traverse_measure() builds one that
+moves the printer through the points and reduces what it acquires at each, e.g. with the five hole probe processing:
+
+    reduce = lambda points, V: reduce_voltages(V, Pref, density, calib_data, points[:, 0], points[:, 2])
+    measure = traverse_measure(Ender3, read_voltages, reduce)
+    scan = adaptive_scan(measure, 8, 8, 100.0, 100.0, thresholds=[2.0, 0.05], quantities=("vel", "Ptotal"),
+                         budget=1500)
+"""
+
+import argparse
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+from ScanGrid import PLANES, _margins
+from Traverse import run_points
+
+FACTOR = 3 # Each refined cell is split into FACTOR by FACTOR cells. Odd, so the parent center is reused.
+
+class AdaptiveScan:
+    """Cells of an adaptive scan, in the order they were made. *leaves* selects the cells of the final scan, e.g.
+    values[leaves] are the values at *points*.
+
+        cells: (N,4) [u,v,w,h] center and size of every cell in scanning area coordinates. A refined cell stays in
+            the list, followed later by its children, the center child at the same point first.
+        values: (N,K) measured values of every cell. The center child has the value of its parent.
+        level: (N,) number of times every cell was refined from the coarse grid.
+        split: (N,) True for cells that were refined. The other cells tile the scanning area.
+        passes: Number of points measured in each pass, the coarse grid first.
+        converged: True if no neighbouring cells still differ by more than the thresholds, apart from cells already
+            at their minimum size.
+        plane, offset: As *grid_points*.
+    """
+
+    def __init__(self, cells, values, level, split, passes, converged, plane="XZ", offset=0.0):
+        self.cells = cells
+        self.values = values
+        self.level = level
+        self.split = split
+        self.passes = passes
+        self.converged = converged
+        self.plane = plane
+        self.offset = offset
+
+    def __len__(self):
+        """Number of points measured."""
+
+        return int(sum(self.passes))
+
+    @property
+    def leaves(self):
+        """Indices of the cells that tile the scanning area."""
+
+        return np.flatnonzero(~self.split)
+
+    @property
+    def points(self):
+        """(M,3) [x,y,z] printer coordinates of the centers of the cells tiling the scanning area. Every measured
+        point appears once."""
+
+        return _to_points(self.cells[self.leaves], self.plane, self.offset)
+
+    def uniform_count(self):
+        """Number of points a uniform grid at the finest spacing reached would need."""
+
+        if not len(self.cells):
+            return 0
+        return int(self.passes[0]*FACTOR**(2*self.level.max()))
+
+    def summary(self):
+        return "{} points in {} passes ({}), {} for a uniform grid at the finest spacing".format(
+            len(self), len(self.passes), "converged" if self.converged else "not converged", self.uniform_count())
+
+def _to_points(cells, plane, offset):
+    width_axis, height_axis, normal_axis = PLANES[plane.upper()]
+    points = np.empty((len(cells), 3))
+    points[:, width_axis] = cells[:, 0]
+    points[:, height_axis] = cells[:, 1]
+    points[:, normal_axis] = offset
+    return points
+
+def _values(result, quantities, count):
+    """Returns the (N,K) values of a measure() **result**: an array, or a dict of columns to take **quantities**
+    from."""
+
+    if isinstance(result, dict):
+        if quantities is None:
+            raise ValueError("quantities must be given when measure returns columns.")
+        result = np.column_stack([np.asarray(result[name], dtype=float) for name in quantities])
+    return np.asarray(result, dtype=float).reshape(count, -1)
+
+def _touching(first, second, tol):
+    """True for the pairs of cells in **first** and **second** rows that share an edge."""
+
+    gap_u = np.abs(first[..., 0] - second[..., 0]) - (first[..., 2] + second[..., 2])/2.0
+    gap_v = np.abs(first[..., 1] - second[..., 1]) - (first[..., 3] + second[..., 3])/2.0
+    return ((np.abs(gap_u) <= tol) & (gap_v < -tol)) | ((np.abs(gap_v) <= tol) & (gap_u < -tol))
+
+def neighbour_pairs(cells, chunk_size=512):
+    """Returns the (M,2) indices of cells sharing an edge, sorted. Cells only touching at a corner are not
+    neighbours.
+
+    With scipy, the candidates of every pair of cell sizes come from a cKDTree search within the distance at which
+    cells of those sizes touch. Without it, every pair of cells is compared, **chunk_size** rows at a time.
+    """
+
+    cells = np.asarray(cells, dtype=float).reshape(-1, 4)
+    tol = 1e-9*max(1.0, float(np.abs(cells).max())) if len(cells) else 0.0
+    pairs = []
+    if cKDTree is None or not len(cells):
+        for first in range(0, len(cells), chunk_size):
+            ind, other = np.nonzero(_touching(cells[first:first + chunk_size, None, :], cells, tol))
+            ind += first
+            keep = ind < other
+            pairs.append(np.column_stack([ind[keep], other[keep]]))
+        return np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+
+    # Refined cells come in a few sizes, so searching size by size keeps the candidates of each cell to the few
+    # cells around it instead of every cell within the largest size.
+    sizes, size_group = np.unique(cells[:, 2:], axis=0, return_inverse=True)
+    groups = [np.flatnonzero(size_group.ravel() == group) for group in range(len(sizes))]
+    trees = [cKDTree(cells[ids, :2]) for ids in groups]
+    for a in range(len(sizes)):
+        for b in range(a, len(sizes)):
+            radius = (sizes[a] + sizes[b]).max()/2.0 + tol
+            if a == b:
+                found = trees[a].query_pairs(radius, p=np.inf, output_type='ndarray')
+                first, second = groups[a][found[:, 0]], groups[a][found[:, 1]]
+            else:
+                found = trees[a].sparse_distance_matrix(trees[b], radius, p=np.inf, output_type='ndarray')
+                first, second = groups[a][found['i']], groups[b][found['j']]
+            keep = _touching(cells[first], cells[second], tol)
+            pairs.append(np.column_stack([first[keep], second[keep]]))
+    pairs = np.sort(np.concatenate(pairs), axis=1).astype(np.int64)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+def refinement_scores(cells, values, thresholds):
+    """Returns the (N,) largest change to any neighbour of every cell, relative to the **thresholds** of each value.
+    Cells scoring above 1 need refining."""
+
+    pairs = neighbour_pairs(cells)
+    scores = np.zeros(len(cells))
+    if len(pairs):
+        change = np.abs(values[pairs[:, 0]] - values[pairs[:, 1]])/thresholds
+        change = np.nan_to_num(change, nan=np.inf).max(axis=1)
+        np.maximum.at(scores, pairs[:, 0], change)
+        np.maximum.at(scores, pairs[:, 1], change)
+    return scores
+
+def _split(cells):
+    """Returns the (9*N,4) children of the (N,4) **cells** split FACTOR by FACTOR, cell by cell with the center child
+    of each first."""
+
+    steps = np.arange(FACTOR) - (FACTOR - 1)//2
+    du, dv = [axis.ravel() for axis in np.meshgrid(steps, steps, indexing='ij')]
+    order = np.argsort((du != 0) | (dv != 0), kind='stable')
+    du, dv = du[order], dv[order]
+    w = cells[:, 2:3]/FACTOR
+    h = cells[:, 3:4]/FACTOR
+    u = (cells[:, 0:1] + du*w).ravel()
+    v = (cells[:, 1:2] + dv*h).ravel()
+    count = len(du)
+    return np.column_stack([u, v, np.repeat(w.ravel(), count), np.repeat(h.ravel(), count)])
+
+def adaptive_scan(measure, n_w, n_h, height, width, thresholds, quantities=None, budget=None, min_size=None,
+                  max_passes=10, plane="XZ", offset=0.0, margin=0.0, verbose=True):
+    """Runs an adaptive scan and returns an AdaptiveScan.
+
+    measure: Function called with the (N,3) [x,y,z] points of each pass, returning their values as an (N,K) array,
+        or a dict of columns (as reduce_voltages returns) to take **quantities** from.
+    n_w, n_h, height, width, plane, offset, margin: Coarse grid, as *grid_points*. It must be fine enough for every
+        feature to change at least one coarse point, since nothing is refined between points that agree.
+    thresholds: Largest change of each value allowed between neighbouring points, a single value or one per value.
+        This is the tolerance of the scan: the gradient times the point spacing.
+    quantities: Names of the columns to compare when measure returns a dict, e.g. ("vel", "Ptotal").
+    budget: Most points measured in total, including the coarse grid. None for no limit. When a pass cannot refine
+        every cell above the thresholds, the cells with the largest changes are refined first.
+    min_size: Smallest [width,height] of a cell, a single value or a pair. Defaults to the coarse cell size split
+        three times (1/27).
+    max_passes: Most refinement passes after the coarse grid.
+    verbose: Print the points measured in each pass.
+    """
+
+    margin_w, margin_h = _margins(margin)
+    Wb = (width - 2.0*margin_w)/n_w
+    Hb = (height - 2.0*margin_h)/n_h
+    if budget is not None and budget < n_w*n_h:
+        raise ValueError("Budget of {} points is below the {} points of the coarse grid.".format(budget, n_w*n_h))
+    if min_size is None:
+        min_size = (Wb/FACTOR**3, Hb/FACTOR**3)
+    min_w, min_h = _margins(min_size)
+
+    u = margin_w + Wb*(np.arange(n_w) + 0.5)
+    v = margin_h + Hb*(np.arange(n_h) + 0.5)
+    u, v = [axis.ravel() for axis in np.meshgrid(u, v, indexing='ij')]
+    cells = np.column_stack([u, v, np.full(len(u), Wb), np.full(len(u), Hb)])
+    level = np.zeros(len(cells), dtype=np.int64)
+    split = np.zeros(len(cells), dtype=bool)
+
+    values = _values(measure(_to_points(cells, plane, offset)), quantities, len(cells))
+    thresholds = np.broadcast_to(np.asarray(thresholds, dtype=float), values.shape[1:])
+    passes = [len(cells)]
+    if verbose:
+        print("Coarse grid: {} points".format(len(cells)))
+
+    converged = False
+    for _ in range(max_passes):
+        # Cells in the current scan: every split cell is replaced by its children.
+        leaves = np.flatnonzero(~split)
+        scores = refinement_scores(cells[leaves], values[leaves], thresholds)
+        splittable = (cells[leaves, 2]/FACTOR >= min_w*(1 - 1e-9)) & (cells[leaves, 3]/FACTOR >= min_h*(1 - 1e-9))
+        marked = (scores > 1.0) & splittable
+        candidates = leaves[marked]
+        if not len(candidates):
+            converged = True
+            break
+
+        new_per_cell = FACTOR**2 - 1
+        if budget is not None:
+            room = (budget - sum(passes))//new_per_cell
+            if room <= 0:
+                break
+            candidates = candidates[np.argsort(-scores[marked], kind='stable')][:room]
+
+        children = _split(cells[candidates])
+        center = np.arange(len(children)) % FACTOR**2 == 0
+        child_values = np.empty((len(children), values.shape[1]))
+        child_values[center] = values[candidates] # The center child is the parent's point, measured already.
+        child_values[~center] = _values(measure(_to_points(children[~center], plane, offset)), quantities,
+                                        int(np.count_nonzero(~center)))
+        cells = np.vstack([cells, children])
+        values = np.vstack([values, child_values])
+        level = np.concatenate([level, np.repeat(level[candidates] + 1, FACTOR**2)])
+        split[candidates] = True
+        split = np.concatenate([split, np.zeros(len(children), dtype=bool)])
+        passes.append(len(candidates)*new_per_cell)
+        if verbose:
+            print("Pass {}: {} cells refined, {} points, {} in total".format(len(passes) - 1, len(candidates),
+                                                                            passes[-1], sum(passes)))
+
+    return AdaptiveScan(cells, values, level, split, passes, converged, plane, offset)
+
+def traverse_measure(printer, acquire, reduce, order="nearest"):
+    """Returns a measure function for *adaptive_scan* that traverses **printer** through each pass.
+
+    printer: 3D printer defined as object **Printer**.
+    acquire: Function called with each [x,y,z] point once the printer has reached it, returning the sample there,
+        e.g. the 5 port voltages of the five hole probe.
+    reduce: Function called with the (N,3) points of the pass and the (N,...) array of their samples in the same
+        order, returning their values (see *adaptive_scan*).
+    order: Path ordering of each pass (see ScanPath.plan_scan_path), or None to keep the scan order.
+    """
+
+    def measure(points):
+        samples = {}
+        run_points(printer, points, order, progress=lambda point: samples.__setitem__(tuple(point), acquire(point)))
+        return reduce(points, np.array([samples[tuple(point)] for point in points]))
+    return measure
+
+def _wake(points, depth=0.6, half_width=4.0, center=50.0, freestream=20.0):
+    """Synthetic velocity of a 2D wake across x, for the demonstration."""
+
+    return freestream*(1.0 - depth*np.exp(-((points[:, 0] - center)/half_width)**2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Adaptive scan of a synthetic wake, compared to a uniform grid.")
+    parser.add_argument("--coarse", type=int, default=8, help="Coarse grid points across each side.")
+    parser.add_argument("--size", type=float, default=100.0, help="Side of the square scanning area in mm.")
+    parser.add_argument("--threshold", type=float, default=1.0, help="Largest velocity change between neighbours.")
+    parser.add_argument("--budget", type=int, default=None)
+    args = parser.parse_args()
+
+    scan = adaptive_scan(_wake, args.coarse, args.coarse, args.size, args.size, args.threshold,
+                         budget=args.budget)
+    print(scan.summary())
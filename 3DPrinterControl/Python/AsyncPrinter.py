@@ -0,0 +1,264 @@
+import asyncio
+import re
+from collections import deque
+
+from Printer import combined_feedrate, find_port
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+class SerialStream:
+    """Adapts a blocking serial-like object (readline/write/close) to the asyncio reader/writer interface.
+
+    Blocking reads run in the event loop's default executor, so the loop stays free while waiting for the printer.
+    Used when pyserial-asyncio is not installed.
+
+        port: Opened serial port, e.g. serial.Serial with a read timeout.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.closed = False
+
+    async def readline(self):
+        """Returns the next line from the port, or b"" once the stream is closed."""
+
+        loop = asyncio.get_running_loop()
+        while not self.closed:
+            line = await loop.run_in_executor(None, self.port.readline)
+            if line:
+                return line
+        return b""
+
+    def write(self, data):
+        self.port.write(data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+        self.port.close()
+
+class AsyncPrinter:
+    """asyncio counterpart of **Printer**. G-code lines are streamed against the firmware's "ok" replies by a
+    background reader task, so other coroutines (e.g. data acquisition) keep running while the printer moves.
+
+    Use *AsyncPrinter.connect()* to open a printer by name, or pass an already opened stream pair.
+
+        reader: Object with a coroutine readline() returning lines from the printer (b"" at end of stream).
+        writer: Object with write(bytes) and a coroutine drain(). May be the same object as **reader**.
+        xSpeed: Default speed of x-axis in mm/min. Can be set per-action also.
+        ySpeed: Default speed of y-axis in mm/min. Can be set per-action also.
+        zSpeed: Default speed of z-axis in mm/min. Can be set per-action also.
+        bounds: Maximum limits of 3-axes in format: [xMax,yMax,zMax]
+        maxInFlight: Maximum number of sent lines that may be waiting for an "ok".
+        ackTimeout: Seconds to wait for any single "ok" before giving up. None waits indefinitely.
+    """
+
+    def __init__(self, reader, writer, xSpeed=6000, ySpeed=6000, zSpeed=200, bounds=None, maxInFlight=4,
+                 ackTimeout=None):
+
+        self.reader = reader
+        self.writer = writer
+        self.xSpeed = xSpeed
+        self.ySpeed = ySpeed
+        self.zSpeed = zSpeed
+        self.max_x, self.max_y, self.max_z = [1000000]*3 if bounds is None else bounds
+        self.maxInFlight = max(1, int(maxInFlight))
+        self.ackTimeout = ackTimeout
+
+        self.x = 0
+        self.y = 0
+        self.z = 0
+        self.positioning = None # Last G90/G91 mode sent. Unknown until the first move.
+
+        self._waiters = deque() # One future per line waiting for an "ok", oldest first.
+        self._replies = [] # Non-"ok" lines received since the last "ok".
+        self._slots = None
+        self._reader_task = None
+
+    @classmethod
+    async def connect(cls, printerName, baudrate=115200, home=True, **kwargs):
+        """Opens the printer whose serial description contains **printerName** and returns a started AsyncPrinter.
+
+        Uses pyserial-asyncio when installed, otherwise a blocking serial port read from an executor thread.
+        kwargs are passed on to AsyncPrinter.
+        """
+
+        port = find_port(printerName)
+        if port is None:
+            raise IOError("Printer could not be found.")
+        print("Printer found on port {}.\n".format(port))
+
+        if serial_asyncio is not None:
+            reader, writer = await serial_asyncio.open_serial_connection(url=port, baudrate=baudrate)
+        else:
+            from serial import Serial
+            reader = writer = SerialStream(Serial(port, baudrate, timeout=0.5))
+
+        printer = cls(reader, writer, **kwargs)
+        await asyncio.sleep(3) # Board resets when the port opens.
+        await printer.start()
+        if home:
+            await printer.home()
+        return printer
+
+    async def start(self):
+        """Starts the background task that reads the printer's replies."""
+
+        self._slots = asyncio.Semaphore(self.maxInFlight)
+        self._reader_task = asyncio.ensure_future(self._read_replies())
+
+    async def close(self):
+        """Waits for every sent line to be acknowledged, then stops the reader and closes the connection."""
+
+        if self._waiters:
+            await asyncio.gather(*list(self._waiters), return_exceptions=True)
+        self.writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, ConnectionError):
+                pass
+
+    async def _read_replies(self):
+        """Resolves the oldest waiting line on every "ok" with the replies received before it."""
+
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                error = ConnectionError("Printer connection closed.")
+                while self._waiters:
+                    waiter = self._waiters.popleft()
+                    if not waiter.done():
+                        waiter.set_exception(error)
+                return
+
+            line = line.decode('utf-8', 'replace').strip()
+            if line.startswith("ok"):
+                replies, self._replies = self._replies, []
+                if self._waiters:
+                    waiter = self._waiters.popleft()
+                    self._slots.release()
+                    if not waiter.done():
+                        waiter.set_result(replies)
+            elif line.startswith("Error") or line.startswith("!!"):
+                print("PRINTER ERROR: {}".format(line))
+            elif line and not line.startswith("echo:busy"):
+                self._replies.append(line)
+
+    async def send(self, string):
+        """Sends one G-code line once fewer than *maxInFlight* lines are waiting for an "ok".
+
+        Returns a future that resolves to the list of reply lines received before the line's "ok". Raises
+        RuntimeError if *start()* has not run.
+        """
+
+        if self._slots is None:
+            raise RuntimeError("Printer is not started; call start() first.")
+        await asyncio.wait_for(self._slots.acquire(), self.ackTimeout)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.writer.write(str.encode(string))
+        await self.writer.drain()
+        return waiter
+
+    async def _ack(self, waiter, timeout=None):
+        """Waits for **waiter**'s "ok", defaulting to *ackTimeout*."""
+
+        timeout = self.ackTimeout if timeout is None else timeout
+        return await asyncio.wait_for(waiter, timeout)
+
+    async def _set_absolute(self):
+        """Switches the printer to absolute positioning (G90) unless it already is."""
+
+        if self.positioning != "G90":
+            await self.send("G90 \r\n")
+            self.positioning = "G90"
+
+    async def wait(self, timeout=None):
+        """Waits until the printer has finished every queued move (M400).
+
+        timeout: Seconds to wait before raising asyncio.TimeoutError. None waits indefinitely.
+        """
+
+        await asyncio.wait_for(await self.send("M400 \r\n"), timeout)
+
+    async def get_position(self, timeout=None):
+        """Queries the printer's position with M114. Returns [x,y,z] in mm, or None if no position was reported."""
+
+        for reply in await self._ack(await self.send("M114 \r\n"), timeout):
+            match = re.search(r"X:\s*(-?[\d.]+)\s*Y:\s*(-?[\d.]+)\s*Z:\s*(-?[\d.]+)", reply)
+            if match:
+                return [float(value) for value in match.groups()]
+        return None
+
+    async def home(self):
+        """Moves the printer to its home position and waits for it to get there."""
+
+        print("Homing")
+        await self.send("G28 \r\n")
+        self.x = 0
+        self.y = 0
+        self.z = 0
+        await self.wait()
+
+    async def move_to(self, x=None, y=None, z=None, xSpeed=None, ySpeed=None, zSpeed=None):
+        """Queues a move of the carriage to position **x**,**y**,**z** as a single G1 line. Returns once the line
+        is sent; use *wait()* to wait for the move to finish.
+
+        Speeds default to the ones given at object initialization. Each axis stays within its own speed.
+        """
+
+        x = self.x if x is None else float(x)
+        y = self.y if y is None else float(y)
+        z = self.z if z is None else float(z)
+
+        if x > self.max_x or y > self.max_y or z > self.max_z:
+            print("Cannot make move. End position is past maximum position.")
+            return
+
+        speeds = [self.xSpeed if xSpeed is None else xSpeed, self.ySpeed if ySpeed is None else ySpeed,
+                  self.zSpeed if zSpeed is None else zSpeed]
+        dists = [x - self.x, y - self.y, z - self.z]
+        if not any(dists):
+            return
+
+        await self._set_absolute()
+        axes = "".join(" {}{}".format(axis, loc) for axis, loc, dist in zip("XYZ", [x, y, z], dists) if dist != 0)
+        await self.send("G1{} F{} \r\n".format(axes, round(combined_feedrate(dists, speeds), 3)))
+        self.x = x
+        self.y = y
+        self.z = z
+
+    async def move(self, x=0, y=0, z=0, xSpeed=None, ySpeed=None, zSpeed=None):
+        """Queues a move of the carriage by **x**,**y**,**z** as a single G1 line. See *move_to()*."""
+
+        await self.move_to(self.x + float(x), self.y + float(y), self.z + float(z), xSpeed, ySpeed, zSpeed)
+
+    async def run_points(self, points, acquire=None, dwell=None):
+        """Traverses **points**, running **acquire** at each one once the printer has stopped there.
+
+        points: Iterable of [x,y,z] points.
+        acquire: Coroutine function called with each point, e.g. to sample the pressure transducers.
+        dwell: Seconds the carriage must stay still for acquisition. If given, the next move is queued after at
+            most *dwell* seconds while acquire() keeps running (e.g. reading out, averaging or storing samples)
+            concurrently with the motion. If None, the next move waits for acquire() to finish.
+
+        Returns the results of acquire() in point order.
+        """
+
+        tasks = []
+        for point in points:
+            await self.move_to(point[0], point[1], point[2])
+            await self.wait()
+            if acquire is None:
+                continue
+            task = asyncio.ensure_future(acquire(point))
+            tasks.append(task)
+            await asyncio.wait([task], timeout=dwell)
+        return list(await asyncio.gather(*tasks))
@@ -0,0 +1,83 @@
+import os
+import numpy as np
+
+class PointSource:
+    """Iterable of [x,y,z] traverse points read lazily from a .csv or .npy file.
+
+    Points are parsed a chunk at a time, so motion can start as soon as the first chunk is read and memory stays flat
+    for files of any length.
+
+        filename: Path of the points file. A .npy file must hold an (N,3) array and is memory-mapped. Any other file
+            is read as csv in the format:
+            x(mm),y(mm),z(mm) {Header is not read. Can be anything, but is required.)
+            0.0,0.0,0.0
+        start: Index of the first point to yield, e.g. to resume an interrupted traverse.
+        offset: Csv only. Byte offset of point *start* in the file, as returned by *checkpoint()*. Lets a resumed
+            traverse seek straight to the point instead of re-reading the file prefix.
+        chunk_size: Number of points parsed at a time.
+    """
+
+    def __init__(self, filename, start=0, offset=None, chunk_size=1024):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.is_npy = os.path.splitext(filename)[1].lower() == ".npy"
+        self.position = start # Index of the next point to be yielded.
+        self.offset = offset # Csv byte offset of the next point to be yielded.
+
+    def checkpoint(self):
+        """Returns [position,offset] of the next point not yet yielded. Passing them back as *start* and *offset*
+        resumes from that point."""
+
+        return [self.position, self.offset]
+
+    def _seek_csv(self, points_file):
+        """Moves **points_file** to point *position*, skipping the header line and any earlier points."""
+
+        if self.offset is not None:
+            points_file.seek(self.offset)
+            return
+
+        points_file.readline() # Header.
+        skip = self.position
+        while skip > 0:
+            line = points_file.readline()
+            if not line:
+                break
+            if line.strip():
+                skip -= 1
+        self.offset = points_file.tell()
+
+    def chunks(self):
+        """Yields the remaining points as (n,3) arrays of up to *chunk_size* points, with the byte offset after each
+        point (csv) or None (npy)."""
+
+        if self.is_npy:
+            points = np.load(self.filename, mmap_mode='r')
+            for lo in range(self.position, len(points), self.chunk_size):
+                yield np.array(points[lo:lo + self.chunk_size], dtype=float), None
+            return
+
+        with open(self.filename, 'rb') as points_file:
+            self._seek_csv(points_file)
+            offset = self.offset
+            while True:
+                lines = []
+                ends = []
+                for line in points_file:
+                    offset += len(line)
+                    if line.strip():
+                        lines.append(line.split(b',')[:3])
+                        ends.append(offset)
+                        if len(lines) == self.chunk_size:
+                            break
+                if not lines:
+                    return
+                yield np.array(lines, dtype=float), ends
+
+    def __iter__(self):
+        for chunk, ends in self.chunks():
+            for ind, point in enumerate(chunk):
+                self.position += 1
+                if ends is not None:
+                    self.offset = ends[ind]
+                yield point
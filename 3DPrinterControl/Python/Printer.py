@@ -1,8 +1,26 @@
-from serial import Serial
+from serial import Serial, SerialTimeoutException
 import serial.tools.list_ports
+from collections import deque
+import math
+import re
 import sys
 import time
 
+def find_port(printerName):
+    """Returns the serial device whose description contains **printerName**, or None if there is none."""
+
+    for port in serial.tools.list_ports.comports():
+        if printerName in port.description:
+            return port.device
+    return None
+
+def combined_feedrate(dists,speeds):
+    """Returns the path feedrate (mm/min) for a move of *dists* along [x,y,z] that keeps each axis at or
+    below its entry in *speeds*."""
+
+    length = math.sqrt(sum(dist**2 for dist in dists))
+    return min(speed*length/abs(dist) for dist, speed in zip(dists, speeds) if dist != 0)
+
 class Printer(Serial):
     """Class that represents a 3D Printer using Serial connection. Can be used to intuitively control motion of printer.
 
@@ -12,10 +30,44 @@ class Printer(Serial):
         ySpeed: Default speed of y-axis in mm/min. Can be set per-action also.
         zSpeed: Default speed of z-axis in mm/min. Can be set per-action also.
         bounds: Maximum limits of 3-axes in format: [xMax,yMax,zMax]
+        streaming: If True, G-code lines are streamed against the firmware's "ok" replies instead of being
+            followed by fixed sleeps.
+        maxInFlight: Streaming only. Maximum number of sent lines that may be waiting for an "ok".
+        rxBufferSize: Streaming only. If given, also limits the unacknowledged characters in flight to this many
+            bytes (character-counting). Should not exceed the firmware's serial receive buffer (128 on Marlin).
+        ackTimeout: Seconds to wait for any single "ok" before giving up. None waits indefinitely.
+        waitTimeout: Default seconds *wait()* may block for the printer to finish moving. None waits indefinitely.
+        confirmMoves: If True, *wait()* reads back the position with M114 after every move and warns on mismatch.
+        combinedMoves: If True, *moveTo()* and *move()* send a single "G1 X.. Y.. Z.. F.." line so all axes move
+            together, at the fastest feedrate that keeps every axis within its own speed.
+        transport: Object to talk to instead of a serial port, e.g. PrinterSimulator.MarlinSimulator. Must provide
+            write(bytes) and readline() (returning b"" on timeout), and may provide now() and sleep(seconds) to put
+            the printer on its clock. *printerName* and *baudrate* are not used when given.
+        tracer: Optional PrinterTrace.PrinterTrace recording the send and ack time, size, queue depth and blocked
+            time of every line, grouped into moves and traverse points.
     """
 
-    def __init__(self, printerName, baudrate=115200, xSpeed=6000, ySpeed=6000, zSpeed=200, bounds=None):
-        
+    def __init__(self, printerName=None, baudrate=115200, xSpeed=6000, ySpeed=6000, zSpeed=200, bounds=None,
+                 streaming=False, maxInFlight=4, rxBufferSize=None, ackTimeout=None, waitTimeout=None,
+                 confirmMoves=False, combinedMoves=False, transport=None, tracer=None):
+        
+        self.transport = transport
+        self._now = getattr(transport, "now", time.monotonic)
+        self._sleep = getattr(transport, "sleep", time.sleep)
+        self.tracer = tracer
+        if tracer is not None:
+            tracer.attach(self)
+        self.streaming = streaming
+        self.maxInFlight = max(1, int(maxInFlight))
+        self.rxBufferSize = rxBufferSize
+        self.ackTimeout = ackTimeout
+        self.waitTimeout = waitTimeout
+        self.confirmMoves = confirmMoves
+        self.combinedMoves = combinedMoves
+        self.positioning = None # Last G90/G91 mode sent. Unknown until the first move.
+        self.pending = deque() # Byte counts of sent lines still waiting for an "ok".
+        self.pending_chars = 0
+
         if bounds is None:
             print("WARNING: NO BOUNDS SET FOR PRINTER\n")
             self.max_x = 1000000
@@ -26,25 +78,28 @@ class Printer(Serial):
             self.max_y = bounds[1]
             self.max_z = bounds[2]
         
-        ports = list(serial.tools.list_ports.comports())
-        for port in ports:
-            if printerName in port.description:
-                self.p_port = port.device
-                print("Printer found on port {}.\n".format(self.p_port))
-                break
-        else:
-            print("Printer could not be found.")
-            sys.exit()
-
-        try:
-            super(Printer, self).__init__(self.p_port, baudrate, timeout=3)
-            time.sleep(3)
+        if transport is not None:
+            super(Printer, self).__init__()
+            self.p_port = None
             print("PRINTER ECHO:\n\n\n")
-            for line in self.readlines():
+            for line in iter(self.readline, b""):
                 print(line.decode('utf-8').replace("echo:",""))
-        except:
-            print("Serial connection could not be established.")
-            sys.exit()
+        else:
+            self.p_port = find_port(printerName)
+            if self.p_port is None:
+                print("Printer could not be found.")
+                sys.exit()
+            print("Printer found on port {}.\n".format(self.p_port))
+
+            try:
+                super(Printer, self).__init__(self.p_port, baudrate, timeout=3)
+                time.sleep(3)
+                print("PRINTER ECHO:\n\n\n")
+                for line in self.readlines():
+                    print(line.decode('utf-8').replace("echo:",""))
+            except:
+                print("Serial connection could not be established.")
+                sys.exit()
         
         self.home()
         
@@ -57,20 +112,158 @@ class Printer(Serial):
         self.zSpeed = zSpeed
 
     def write(self,string):
-        """Encodes string then passes to Serial.write() super."""
-        super(Printer, self).write(str.encode(string))
-
-    # This function needs to be updated to intelligently wait for the end of the action.
-    # Currently it only waits a set amount of time.
-    def wait(self):
-        """Function that sleeps program until printer has stopped moving."""
-        time.sleep(0.5)
-        # TODO: Update function to intelligently wait for command to finish.
+        """Encodes string then passes to Serial.write() super, or to the transport if one was given."""
+        if self.transport is not None:
+            self.transport.write(str.encode(string))
+        else:
+            super(Printer, self).write(str.encode(string))
+
+    def readline(self,size=-1):
+        """Reads one line from the printer, or from the transport if one was given. Returns b"" on timeout."""
+        if self.transport is not None:
+            return self.transport.readline()
+        return super(Printer, self).readline(size)
+
+    def send(self,string):
+        """Sends one G-code line to the printer.
+
+        In streaming mode the line is held back until the printer has acknowledged enough earlier lines to
+        stay within *maxInFlight* (and *rxBufferSize*), so lines go out as fast as the planner accepts them.
+        Otherwise the line is followed by a fixed 0.1 s sleep.
+        """
+
+        if not self.streaming:
+            self._queue(string)
+            self._sleep(0.1)
+            if self.tracer is not None:
+                self.tracer.slept(0.1)
+            return
+
+        size = len(string)
+        while self.pending and (len(self.pending) >= self.maxInFlight or
+                                (self.rxBufferSize is not None and self.pending_chars + size > self.rxBufferSize)):
+            self._read_ack()
+
+        self._queue(string)
+
+    def _queue(self,string):
+        """Writes a line and records it as waiting for an "ok"."""
+
+        self.write(string)
+        self.pending.append(len(string))
+        self.pending_chars += len(string)
+        if self.tracer is not None:
+            self.tracer.sent(string, len(self.pending), self.pending_chars)
+
+    def _read_ack(self,deadline=None):
+        """Reads printer replies until the next "ok" and releases the oldest line in flight.
+
+        deadline: self._now() value after which SerialTimeoutException is raised. Defaults to *ackTimeout*.
+
+        Returns the non-"ok" lines received on the way (e.g. the reply of a query command).
+        """
+
+        replies = []
+        start = self._now()
+        if deadline is None and self.ackTimeout is not None:
+            deadline = start + self.ackTimeout
+        while True:
+            line = self.readline()
+            if not line:
+                if deadline is not None and self._now() > deadline:
+                    raise SerialTimeoutException("Timed out waiting for a reply from the printer.")
+                continue
+
+            line = line.decode('utf-8', 'replace').strip()
+            if line.startswith("ok"):
+                if self.pending:
+                    self.pending_chars -= self.pending.popleft()
+                    if self.tracer is not None:
+                        self.tracer.acked(self._now() - start)
+                return replies
+            elif line.startswith("Error") or line.startswith("!!"):
+                print("PRINTER ERROR: {}".format(line))
+            elif not line.startswith("echo:busy"):
+                replies.append(line)
+
+    def sync(self,timeout=None):
+        """Blocks until every line sent so far has been acknowledged by the printer.
+
+        timeout: Seconds to wait before raising SerialTimeoutException. None waits indefinitely.
+        """
+
+        deadline = None if timeout is None else self._now() + timeout
+        while self.pending:
+            self._read_ack(deadline)
+
+    def wait(self,timeout=None,confirm=None):
+        """Function that blocks program until printer has stopped moving.
+
+        Sends M400 (finish moves) and waits for its "ok", so the wait lasts exactly as long as the queued motion.
+
+        timeout: Seconds to wait before raising SerialTimeoutException. If none given, defaults to *waitTimeout*.
+        confirm: If True, read back the position with M114 and warn if it differs from the tracked position.
+            If none given, defaults to *confirmMoves*.
+        """
+
+        timeout = self.waitTimeout if timeout is None else timeout
+        confirm = self.confirmMoves if confirm is None else confirm
+
+        if self.streaming:
+            self.send("M400 \r\n")
+        else:
+            self._queue("M400 \r\n")
+        self.sync(timeout)
+
+        if confirm:
+            position = self.getPosition(timeout)
+            if position is None:
+                print("WARNING: Printer did not report its position.")
+            elif any(abs(actual - expected) > 0.01 for actual, expected in zip(position, [self.x, self.y, self.z])):
+                print("WARNING: Printer is at x: {} y: {} z: {}, expected x: {} y: {} z: {}.".format(
+                    *position, self.x, self.y, self.z))
+
+        if self.tracer is not None:
+            self.tracer.moved([self.x, self.y, self.z])
+
+    def getPosition(self,timeout=None):
+        """Queries the printer's position with M114. Returns [x,y,z] in mm, or None if no position was reported.
+
+        timeout: Seconds to wait before raising SerialTimeoutException. None waits indefinitely.
+        """
+
+        deadline = None if timeout is None else self._now() + timeout
+        while self.pending:
+            self._read_ack(deadline)
+        self._queue("M114 \r\n")
+
+        for reply in self._read_ack(deadline):
+            match = re.search(r"X:\s*(-?[\d.]+)\s*Y:\s*(-?[\d.]+)\s*Z:\s*(-?[\d.]+)", reply)
+            if match:
+                return [float(value) for value in match.groups()]
+        return None
     
+    def _set_absolute(self):
+        """Switches the printer to absolute positioning (G90) unless it already is."""
+
+        if self.positioning != "G90":
+            self.send("G90 \r\n")
+            self.positioning = "G90"
+
+    def _set_relative(self):
+        """Switches the printer to relative positioning (G91) unless it already is."""
+
+        if self.positioning != "G91":
+            self.send("G91 \r\n")
+            self.positioning = "G91"
+
     def home(self):
         """Function sends serial command for printer to move to home position."""
         print("Homing")
-        self.write("G28 \r\n")
+        self.send("G28 \r\n")
+        self.x = 0
+        self.y = 0
+        self.z = 0
         self.wait()
     
     def moveX(self,dist,speed=None):
@@ -96,12 +289,8 @@ class Printer(Serial):
         
         write_line = "G1 X{} F{} \r\n".format(dist,speed)
         
-        self.write("G91 \r\n") #Set to relative motion.
-        time.sleep(0.1)
-        self.write(write_line)
-        time.sleep(0.1)
-        self.write("G90 \r\n") #Return to absolute motion.
-        time.sleep(0.1)
+        self._set_relative()
+        self.send(write_line)
         
         self.x = self.x + dist
         self.wait()
@@ -129,12 +318,8 @@ class Printer(Serial):
             
         write_line = "G1 Y{} F{} \r\n".format(dist,speed)
         
-        self.write("G91 \r\n") #Set to relative motion.
-        time.sleep(0.1)
-        self.write(write_line)
-        time.sleep(0.1)
-        self.write("G90 \r\n") #Return to absolute motion.
-        time.sleep(0.1)
+        self._set_relative()
+        self.send(write_line)
         
         self.y = self.y + dist
         self.wait()
@@ -161,12 +346,8 @@ class Printer(Serial):
             
         write_line = "G1 Z{} F{} \r\n".format(dist,speed)
         
-        self.write("G91 \r\n") #Set to relative motion.
-        time.sleep(0.1)
-        self.write(write_line)
-        time.sleep(0.1)
-        self.write("G90 \r\n") #Return to absolute motion.
-        time.sleep(0.1)
+        self._set_relative()
+        self.send(write_line)
         
         self.z = self.z + dist
         self.wait()
@@ -193,10 +374,8 @@ class Printer(Serial):
         
         write_line = "G1 X{} F{} \r\n".format(loc,speed)
         
-        self.write("G90 \r\n") #Set to absolute motion.
-        time.sleep(0.1)
-        self.write(write_line)
-        time.sleep(0.1)
+        self._set_absolute()
+        self.send(write_line)
         
         self.x = loc
         self.wait()
@@ -223,10 +402,8 @@ class Printer(Serial):
             
         write_line = "G1 Y{} F{} \r\n".format(loc,speed)
         
-        self.write("G90 \r\n") #Set to absolute motion.
-        time.sleep(0.1)
-        self.write(write_line)
-        time.sleep(0.1)
+        self._set_absolute()
+        self.send(write_line)
         
         self.y = loc
         self.wait()
@@ -255,10 +432,8 @@ class Printer(Serial):
             
         write_line = "G1 Z{} F{} \r\n".format(loc,speed)
         
-        self.write("G90 \r\n") #Set to absolute motion.
-        time.sleep(0.1)
-        self.write(write_line)
-        time.sleep(0.1)
+        self._set_absolute()
+        self.send(write_line)
         
         self.z = loc
         self.wait()
@@ -273,6 +448,13 @@ class Printer(Serial):
         ySpeed: speed of y-axis movement in mm. If none given, defaults to default y-speed given at object initialization.
         zSpeed: speed of z-axis movement in mm. If none given, defaults to default z-speed given at object initialization.
         """
+
+        if x is None:
+            x = self.x
+        if y is None:
+            y = self.y
+        if z is None:
+            z = self.z
         
         if x > self.max_x:
             print("Cannot make move. End position is past maximum x position.")
@@ -290,14 +472,6 @@ class Printer(Serial):
         ySpeed = self.ySpeed if ySpeed is None else ySpeed
         zSpeed = self.zSpeed if zSpeed is None else zSpeed
         
-    
-        if x is None:
-            x = self.x
-        if y is None:
-            y = self.y
-        if z is None:
-            z = self.z
-        
         try:
             x = float(x)
             y = float(y)
@@ -309,19 +483,23 @@ class Printer(Serial):
             print("Invalid value(s) for movement")
             return
         
-        
-        write_line_x = "G1 X{} F{} \r\n".format(x,xSpeed)
-        write_line_y = "G1 Y{} F{} \r\n".format(y,ySpeed)
-        write_line_z = "G1 Z{} F{} \r\n".format(z,zSpeed)
-        
-        self.write("G90 \r\n") #Set to absolute motion.
-        time.sleep(0.1)
-        self.write(write_line_z)
-        time.sleep(0.1)
-        self.write(write_line_y)
-        time.sleep(0.1)
-        self.write(write_line_x)
-        time.sleep(0.1)
+        dists = [x - self.x, y - self.y, z - self.z]
+        if self.combinedMoves and not any(dists):
+            return # Already there; nothing is sent, not even the positioning mode.
+
+        self._set_absolute()
+        if self.combinedMoves:
+            axes = "".join(" {}{}".format(axis, loc) for axis, loc, dist in zip("XYZ", [x, y, z], dists) if dist != 0)
+            feed = combined_feedrate(dists, [xSpeed, ySpeed, zSpeed])
+            self.send("G1{} F{} \r\n".format(axes, round(feed, 3)))
+        else:
+            write_line_x = "G1 X{} F{} \r\n".format(x,xSpeed)
+            write_line_y = "G1 Y{} F{} \r\n".format(y,ySpeed)
+            write_line_z = "G1 Z{} F{} \r\n".format(z,zSpeed)
+
+            self.send(write_line_z)
+            self.send(write_line_y)
+            self.send(write_line_x)
         
         self.x = x
         self.y = y
@@ -366,20 +544,23 @@ class Printer(Serial):
             print("Invalid value(s) for movement")
             return
             
-        write_line_x = "G1 X{} F{} \r\n".format(x,xSpeed)
-        write_line_y = "G1 Y{} F{} \r\n".format(y,ySpeed)
-        write_line_z = "G1 Z{} F{} \r\n".format(z,zSpeed)
-        
-        self.write("G91 \r\n") #Set to relative motion.
-        time.sleep(0.1)
-        self.write(write_line_x)
-        time.sleep(0.1)
-        self.write(write_line_y)
-        time.sleep(0.1)
-        self.write(write_line_z)
-        time.sleep(0.1)
-        self.write("G90 \r\n") #Return to absolute motion.
-        time.sleep(0.1)
+        dists = [x, y, z]
+        if self.combinedMoves and not any(dists):
+            return
+
+        self._set_relative()
+        if self.combinedMoves:
+            axes = "".join(" {}{}".format(axis, dist) for axis, dist in zip("XYZ", dists) if dist != 0)
+            feed = combined_feedrate(dists, [xSpeed, ySpeed, zSpeed])
+            self.send("G1{} F{} \r\n".format(axes, round(feed, 3)))
+        else:
+            write_line_x = "G1 X{} F{} \r\n".format(x,xSpeed)
+            write_line_y = "G1 Y{} F{} \r\n".format(y,ySpeed)
+            write_line_z = "G1 Z{} F{} \r\n".format(z,zSpeed)
+
+            self.send(write_line_x)
+            self.send(write_line_y)
+            self.send(write_line_z)
         
         self.x = self.x + x
         self.y = self.y + y
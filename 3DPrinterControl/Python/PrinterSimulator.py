@@ -0,0 +1,246 @@
+import math
+from collections import deque
+
+class SimClock:
+    """Virtual clock shared by a simulated device and the code driving it. Nothing really sleeps; time only
+    advances when the host sleeps or blocks on a read.
+
+        slept: Total seconds the host spent in *sleep()*.
+        blocked: Total seconds the host spent blocked on reads.
+    """
+
+    def __init__(self):
+        self.t = 0.0
+        self.slept = 0.0
+        self.blocked = 0.0
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.t += seconds
+        self.slept += seconds
+
+    def block_until(self, t):
+        if t > self.t:
+            self.blocked += t - self.t
+            self.t = t
+
+class SerialSimulator:
+    """Base of in-process stand-ins for a device's serial port, running on a **SimClock**.
+
+    Lines written by the host are timed at **baudrate** and passed with their arrival time to *_process()*, which
+    subclasses implement to model the firmware and queue replies with *_reply()*. MarlinSimulator and the rotation
+    rig's RigSimulator are built on it.
+
+        clock: SimClock to run on. A new one is created if none given.
+        baudrate: Serial speed used to time the transmission of each line.
+        timeout: Seconds *readline()* blocks before returning b"" when nothing is due, like a serial read timeout.
+    """
+
+    def __init__(self, clock=None, baudrate=115200, timeout=3.0):
+        self.clock = SimClock() if clock is None else clock
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.output = deque() # Replies as [time due,line].
+        self.rx = b""
+
+        self.bytes_received = 0
+        self.lines_received = 0
+
+    # Transport interface used by the drivers.
+
+    def now(self):
+        return self.clock.now()
+
+    def sleep(self, seconds):
+        self.clock.sleep(seconds)
+
+    def write(self, data):
+        """Receives bytes from the host. Complete lines are processed once they have been transmitted."""
+
+        arrival = self.clock.now()
+        self.rx += data
+        while b"\n" in self.rx:
+            line, self.rx = self.rx.split(b"\n", 1)
+            arrival += (len(line) + 1)*10.0/self.baudrate
+            self.bytes_received += len(line) + 1
+            self.lines_received += 1
+            self._process(line.decode('ascii', 'replace'), arrival)
+        return len(data)
+
+    def readline(self):
+        """Returns the next reply, blocking (in simulated time) up to *timeout* for it to become due."""
+
+        now = self.clock.now()
+        if self.output and self.output[0][0] <= now + self.timeout:
+            due, line = self.output.popleft()
+            self.clock.block_until(due)
+            return line
+        self.clock.block_until(now + self.timeout)
+        return b""
+
+    @property
+    def in_waiting(self):
+        now = self.clock.now()
+        return sum(len(line) for due, line in self.output if due <= now)
+
+    def close(self):
+        pass
+
+    def _reply(self, due, text):
+        self.output.append((due, (text + "\n").encode('ascii')))
+
+    def _process(self, line, arrival):
+        """Handles one received **line** that finished arriving at time **arrival**."""
+
+        raise NotImplementedError
+
+class MarlinSimulator(SerialSimulator):
+    """In-process stand-in for the serial port of a Marlin printer, usable as the *transport* of **Printer**.
+
+    Parses G0/G1/G28/G90/G91/G92/M400/M114, answers with "ok" when Marlin would, and times every move with a
+    trapezoidal velocity profile limited by per-axis feedrates and accelerations. Moves are queued in a planner of
+    *planner_size* moves like the firmware's, so "ok" replies are held back while the planner is full. Moves always
+    start and end at rest, so durations are slightly pessimistic compared to Marlin's junction blending.
+
+    All timing runs on a **SimClock**, so traverses of any length simulate in a fraction of their real duration.
+
+        clock: SimClock to run on. A new one is created if none given.
+        baudrate: Serial speed used to time the transmission of each line.
+        timeout: Seconds *readline()* blocks before returning b"" when nothing is due, like a serial read timeout.
+        max_feedrate: Per-axis maximum speeds [x,y,z] in mm/s.
+        acceleration: Per-axis accelerations [x,y,z] in mm/s^2.
+        homing_feedrate: Per-axis homing speeds [x,y,z] in mm/min.
+        bounds: Per-axis travel limits [xMax,yMax,zMax] in mm. If given, moves are clamped to them like software
+            endstops.
+        planner_size: Number of moves the firmware buffers.
+        command_time: Seconds the firmware spends parsing each line.
+        keepalive: Interval in seconds of "echo:busy: processing" messages while the firmware is blocked.
+    """
+
+    def __init__(self, clock=None, baudrate=115200, timeout=3.0, max_feedrate=(500.0, 500.0, 5.0),
+                 acceleration=(500.0, 500.0, 100.0), homing_feedrate=(3000.0, 3000.0, 240.0),
+                 bounds=None, planner_size=16, command_time=0.0005, keepalive=2.0):
+
+        super(MarlinSimulator, self).__init__(clock, baudrate, timeout)
+        self.max_feedrate = max_feedrate
+        self.acceleration = acceleration
+        self.homing_feedrate = homing_feedrate
+        self.bounds = bounds
+        self.planner_size = planner_size
+        self.command_time = command_time
+        self.keepalive = keepalive
+
+        self.position = [0.0, 0.0, 0.0]
+        self.feedrate = 1500.0 # mm/min
+        self.relative = False
+
+        self.ready = 0.0 # Time the firmware can process its next line.
+        self.moves = deque() # End times of planned moves not yet finished.
+        self.last_end = 0.0 # End time of the last planned move.
+
+        self.moves_planned = 0
+        self.motion_time = 0.0
+
+        self._reply(0.0, "start")
+        self._reply(0.0, "echo:Marlin simulator")
+
+    # Firmware model.
+
+    def _block(self, start, end):
+        """Advances the firmware to *end*, sending keepalive messages while it is blocked."""
+
+        if self.keepalive:
+            t = start + self.keepalive
+            while t < end:
+                self._reply(t, "echo:busy: processing")
+                t += self.keepalive
+        return max(start, end)
+
+    def move_time(self, dists, feedrate):
+        """Returns the seconds needed to move by *dists* [x,y,z] mm at *feedrate* mm/min, starting and ending at rest."""
+
+        length = math.sqrt(sum(dist**2 for dist in dists))
+        if length == 0:
+            return 0.0
+        speed = feedrate/60.0
+        accel = float("inf")
+        for dist, axis_speed, axis_accel in zip(dists, self.max_feedrate, self.acceleration):
+            if dist != 0:
+                speed = min(speed, axis_speed*length/abs(dist))
+                accel = min(accel, axis_accel*length/abs(dist))
+
+        if length >= speed**2/accel:
+            return length/speed + speed/accel
+        return 2.0*math.sqrt(length/accel)
+
+    def _plan(self, t, dists, duration):
+        """Adds a move to the planner at time *t*. Returns the time the firmware is free to read the next line."""
+
+        while self.moves and self.moves[0] <= t:
+            self.moves.popleft()
+        if len(self.moves) >= self.planner_size:
+            t = self._block(t, self.moves.popleft())
+
+        start = max(t, self.last_end)
+        self.last_end = start + duration
+        self.moves.append(self.last_end)
+        self.moves_planned += 1
+        self.motion_time += duration
+        return t
+
+    def _process(self, line, arrival):
+        t = max(self.ready, arrival) + self.command_time
+        words = line.split(";")[0].upper().split()
+        if not words:
+            self.ready = t
+            return
+
+        command = words[0]
+        params = {}
+        for word in words[1:]:
+            try:
+                params[word[0]] = float(word[1:]) if len(word) > 1 else None
+            except ValueError:
+                params[word[0]] = None
+
+        if command in ("G0", "G1"):
+            if params.get("F") is not None:
+                self.feedrate = params["F"]
+            target = list(self.position)
+            for ind, axis in enumerate("XYZ"):
+                if params.get(axis) is not None:
+                    target[ind] = params[axis] + (self.position[ind] if self.relative else 0.0)
+                    if self.bounds is not None:
+                        target[ind] = min(max(target[ind], 0.0), self.bounds[ind])
+            dists = [new - old for new, old in zip(target, self.position)]
+            self.position = target
+            t = self._plan(t, dists, self.move_time(dists, self.feedrate))
+        elif command == "G28":
+            axes = [ind for ind, axis in enumerate("XYZ") if axis in params] or [0, 1, 2]
+            start = max(t, self.last_end)
+            duration = sum(abs(self.position[ind])/(self.homing_feedrate[ind]/60.0) for ind in axes)
+            for ind in axes:
+                self.position[ind] = 0.0
+            self.moves.clear()
+            self.motion_time += duration
+            t = self.last_end = self._block(t, start + duration)
+        elif command == "G90":
+            self.relative = False
+        elif command == "G91":
+            self.relative = True
+        elif command == "G92":
+            for ind, axis in enumerate("XYZ"):
+                if params.get(axis) is not None:
+                    self.position[ind] = params[axis]
+        elif command == "M400":
+            t = self._block(t, self.last_end)
+        elif command == "M114":
+            self._reply(t, "X:{:.2f} Y:{:.2f} Z:{:.2f} E:0.00 Count X:{} Y:{} Z:{}".format(
+                *self.position, *[int(round(loc*80)) for loc in self.position]))
+        else:
+            self._reply(t, 'echo:Unknown command: "{}"'.format(line.strip()))
+
+        self._reply(t, "ok")
+        self.ready = t
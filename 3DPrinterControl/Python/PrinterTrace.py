@@ -0,0 +1,215 @@
+"""Opt-in timing trace of the G-code lines a **Printer** sends.
+
+For every line it records when it was sent and acknowledged, its size, how many lines and bytes were in flight, and
+how long the host was blocked on its account (waiting for its "ok", or sleeping after it when not streaming). Lines
+are grouped into moves, each ending with the M400 of a *Printer.wait()*, and into traverse points, each ending when
+run_points() reaches the next point. The records can be followed live through callbacks and exported as CSV or JSON.
+
+    trace = PrinterTrace()
+    Ender3 = Printer(printerName="USB-SERIAL CH340", streaming=True, tracer=trace)
+    run_points(Ender3, points)
+    print(trace.report())
+    trace.write_json("Ender3_trace.json")
+"""
+
+import json
+from collections import deque
+
+import numpy as np
+
+LINE_FIELDS = ("line", "command", "bytes", "depth", "chars_in_flight", "send_t", "ack_t", "latency", "blocked",
+               "move")
+MOVE_FIELDS = ("move", "x", "y", "z", "lines", "bytes", "start_t", "end_t", "duration", "blocked")
+POINT_FIELDS = ("point", "x", "y", "z", "t", "duration", "moves", "lines", "bytes", "blocked")
+
+class PrinterTrace:
+    """Records the timing of a Printer's G-code lines, moves and traverse points.
+
+    Pass it as the *tracer* of a **Printer**, which puts it on the printer's clock. All times are in seconds on that
+    clock, so traces of a PrinterSimulator.MarlinSimulator are in simulated time.
+
+        on_line: Called with the dict of every line once it is acknowledged (fields LINE_FIELDS).
+        on_move: Called with the dict of every finished move (fields MOVE_FIELDS).
+        on_point: Called with the dict of every traverse point reached (fields POINT_FIELDS).
+        keep: If False, records are only passed to the callbacks and not kept, so a long run uses no memory.
+    """
+
+    def __init__(self, on_line=None, on_move=None, on_point=None, keep=True):
+        self.on_line = on_line
+        self.on_move = on_move
+        self.on_point = on_point
+        self.keep = keep
+        self.now = None
+
+        self.lines = []
+        self.moves = []
+        self.points = []
+        self._in_flight = deque() # Records of sent lines waiting for an "ok", oldest first.
+        self._last = None # Record of the last line sent.
+        self._sent = 0
+        self._move = self._new_total()
+        self._point = self._new_total()
+        self._move_count = 0
+        self._point_count = 0
+        self._point_moves = 0
+        self._point_t = None
+
+    @staticmethod
+    def _new_total():
+        return {"lines": 0, "bytes": 0, "blocked": 0.0, "start_t": None}
+
+    def attach(self, printer):
+        """Puts the trace on **printer**'s clock. Called by Printer."""
+
+        self.now = printer._now
+        if self._point_t is None:
+            self._point_t = self.now()
+
+    # Hooks called by Printer.
+
+    def sent(self, string, depth, chars_in_flight):
+        """A line was written, with **depth** lines and **chars_in_flight** bytes now waiting for an "ok"."""
+
+        record = {"line": self._sent, "command": string.split(" ", 1)[0].strip(), "bytes": len(string),
+                  "depth": depth, "chars_in_flight": chars_in_flight, "send_t": self.now(), "ack_t": None,
+                  "latency": None, "blocked": 0.0, "move": self._move_count}
+        self._sent += 1
+        self._in_flight.append(record)
+        self._last = record
+        for total in (self._move, self._point):
+            total["lines"] += 1
+            total["bytes"] += record["bytes"]
+            if total["start_t"] is None:
+                total["start_t"] = record["send_t"]
+
+    def slept(self, seconds):
+        """The host slept **seconds** after the last line (Printer without streaming)."""
+
+        if self._last is not None:
+            self._last["blocked"] += seconds
+        self._add_blocked(seconds)
+
+    def acked(self, blocked):
+        """The oldest line in flight was acknowledged after the host was blocked **blocked** seconds reading it."""
+
+        if not self._in_flight:
+            return
+        record = self._in_flight.popleft()
+        record["ack_t"] = self.now()
+        record["latency"] = record["ack_t"] - record["send_t"]
+        record["blocked"] += blocked
+        self._add_blocked(blocked)
+        if self.keep:
+            self.lines.append(record)
+        if self.on_line is not None:
+            self.on_line(record)
+
+    def moved(self, position):
+        """A *wait()* finished with the printer at **position** [x,y,z]. Ends the current move."""
+
+        total = self._move
+        end_t = self.now()
+        start_t = end_t if total["start_t"] is None else total["start_t"]
+        record = {"move": self._move_count, "x": position[0], "y": position[1], "z": position[2],
+                  "lines": total["lines"], "bytes": total["bytes"], "start_t": start_t, "end_t": end_t,
+                  "duration": end_t - start_t, "blocked": total["blocked"]}
+        self._move_count += 1
+        self._point_moves += 1
+        self._move = self._new_total()
+        if self.keep:
+            self.moves.append(record)
+        if self.on_move is not None:
+            self.on_move(record)
+
+    def point(self, point):
+        """The traverse reached **point** [x,y,z]. Called by run_points(). The point's totals cover everything since
+        the previous point, including time spent at that point (e.g. acquisition)."""
+
+        total = self._point
+        t = self.now()
+        record = {"point": self._point_count, "x": float(point[0]), "y": float(point[1]), "z": float(point[2]),
+                  "t": t, "duration": t - self._point_t, "moves": self._point_moves, "lines": total["lines"],
+                  "bytes": total["bytes"], "blocked": total["blocked"]}
+        self._point_count += 1
+        self._point_moves = 0
+        self._point_t = t
+        self._point = self._new_total()
+        if self.keep:
+            self.points.append(record)
+        if self.on_point is not None:
+            self.on_point(record)
+
+    def _add_blocked(self, seconds):
+        self._move["blocked"] += seconds
+        self._point["blocked"] += seconds
+
+    # Results.
+
+    def columns(self, records, fields):
+        """Returns the **records** as a dict of arrays, one per field."""
+
+        return {field: np.array([record[field] for record in records]) for field in fields}
+
+    def summary(self):
+        """Returns a dict of totals and latency statistics per command over the kept lines."""
+
+        summary = {"lines": len(self.lines), "moves": len(self.moves), "points": len(self.points),
+                   "bytes": sum(record["bytes"] for record in self.lines),
+                   "blocked": sum(record["blocked"] for record in self.lines)}
+        if self.lines:
+            summary["span"] = self.lines[-1]["ack_t"] - self.lines[0]["send_t"]
+            summary["max_depth"] = max(record["depth"] for record in self.lines)
+        commands = {}
+        for record in self.lines:
+            commands.setdefault(record["command"], []).append(record["latency"])
+        summary["commands"] = {command: {"count": len(latency), "mean": float(np.mean(latency)),
+                                         "p50": float(np.percentile(latency, 50)),
+                                         "p95": float(np.percentile(latency, 95)), "max": float(np.max(latency))}
+                               for command, latency in commands.items()}
+        return summary
+
+    def histogram(self, field="latency", bins=10, width=40):
+        """Returns a text histogram of a line **field** ("latency", "blocked", "depth", ...) over the kept lines."""
+
+        values = self.columns(self.lines, (field,))[field].astype(float)
+        if not len(values):
+            return "No lines traced."
+        counts, edges = np.histogram(values, bins)
+        scale = width/float(counts.max())
+        rows = ["{:>10.4g} - {:<10.4g} {:>7} {}".format(low, high, count, "#"*int(round(count*scale)))
+                for low, high, count in zip(edges[:-1], edges[1:], counts)]
+        return "\n".join(["{} of {} lines:".format(field, len(values))] + rows)
+
+    def report(self):
+        """Returns the summary and the latency histogram as printable text."""
+
+        summary = self.summary()
+        text = ["{lines} lines, {moves} moves, {points} points, {bytes} bytes".format(**summary)]
+        if "span" in summary:
+            text.append("{:.3f} s traced, {:.3f} s blocked, at most {} lines in flight".format(
+                summary["span"], summary["blocked"], summary["max_depth"]))
+        for command, stats in sorted(summary["commands"].items()):
+            text.append("{:>6}: {count:>7} lines, latency mean {mean:.4f} s, p50 {p50:.4f} s, p95 {p95:.4f} s, "
+                        "max {max:.4f} s".format(command, **stats))
+        text.append(self.histogram())
+        return "\n".join(text)
+
+    def write_csv(self, filename, records="lines"):
+        """Writes the kept "lines", "moves" or "points" as csv, one record per row."""
+
+        fields = {"lines": LINE_FIELDS, "moves": MOVE_FIELDS, "points": POINT_FIELDS}[records]
+        with open(filename, 'w') as out_file:
+            out_file.write(",".join(fields) + "\n")
+            for record in getattr(self, records):
+                out_file.write(",".join("" if record[field] is None else "{:.9g}".format(record[field])
+                                        if isinstance(record[field], float) else str(record[field])
+                                        for field in fields) + "\n")
+
+    def write_json(self, filename):
+        """Writes the kept lines, moves and points column by column, with the summary, as JSON."""
+
+        trace = {"summary": self.summary()}
+        for name, fields in (("lines", LINE_FIELDS), ("moves", MOVE_FIELDS), ("points", POINT_FIELDS)):
+            trace[name] = {field: [record[field] for record in getattr(self, name)] for field in fields}
+        with open(filename, 'w') as out_file:
+            json.dump(trace, out_file, separators=(",", ":"))
@@ -0,0 +1,124 @@
+import numpy as np
+
+# Printer axes spanned by each scan plane: (width axis, height axis, normal axis). 0=x, 1=y, 2=z.
+PLANES = {"XZ": (0, 2, 1), "XY": (0, 1, 2), "YZ": (1, 2, 0)}
+
+def _margins(margin):
+    """Returns (width margin, height margin) from a single margin or a pair."""
+
+    return (margin, margin) if np.isscalar(margin) else tuple(margin)
+
+def grid_points(n_w, n_h, height, width, plane="XZ", offset=0.0, margin=0.0, refine=None):
+    """Creates an (N,3) array of [x,y,z] points centered in an **n_w** by **n_h** grid of equal rectangles.
+
+    n_w: Number of rectangles across the width.
+    n_h: Number of rectangles across the height.
+    height: Maximum height of scanning area.
+    width: Maximum width of scanning area.
+    plane: Printer plane the scanning area lies in. One of "XZ", "XY" or "YZ". Width runs along the first axis.
+    offset: Position of the scanning area along the remaining axis.
+    margin: Distance kept clear of the edges of the scanning area. A single value or [width margin, height margin].
+    refine: List of refinement regions [w_min,w_max,h_min,h_max,factor] in scanning area coordinates. Each rectangle
+        whose center lies in a region is split into factor by factor smaller rectangles. Where regions overlap the
+        largest factor is used.
+
+    Points are ordered column by column (width outer, height inner).
+    """
+
+    margin_w, margin_h = _margins(margin)
+    Wb = (width - 2.0*margin_w)/n_w
+    Hb = (height - 2.0*margin_h)/n_h
+
+    u = margin_w + Wb*(np.arange(n_w) + 0.5)
+    v = margin_h + Hb*(np.arange(n_h) + 0.5)
+    u, v = [axis.ravel() for axis in np.meshgrid(u, v, indexing='ij')]
+
+    if refine:
+        factors = np.ones(len(u), dtype=np.int64)
+        for w_min, w_max, h_min, h_max, factor in refine:
+            inside = (u >= w_min) & (u <= w_max) & (v >= h_min) & (v <= h_max)
+            factors[inside] = np.maximum(factors[inside], int(factor))
+
+        us = [u[factors == 1]]
+        vs = [v[factors == 1]]
+        for factor in np.unique(factors[factors > 1]):
+            cells = factors == factor
+            steps = (np.arange(factor) + 0.5)/factor - 0.5
+            du, dv = [axis.ravel() for axis in np.meshgrid(steps*Wb, steps*Hb, indexing='ij')]
+            us.append((u[cells, None] + du).ravel())
+            vs.append((v[cells, None] + dv).ravel())
+        u = np.concatenate(us)
+        v = np.concatenate(vs)
+        order = np.lexsort((v, u))
+        u = u[order]
+        v = v[order]
+
+    width_axis, height_axis, normal_axis = PLANES[plane.upper()]
+    points = np.empty((len(u), 3))
+    points[:, width_axis] = u
+    points[:, height_axis] = v
+    points[:, normal_axis] = offset
+    return points
+
+def get_scan_points_area(tArea,height,width,plane="XZ",offset=0.0,margin=0.0,refine=None,verbose=True):
+    """Creates an (N,3) array of [x,y,z] points with points centered in rectangles with area close to **tArea**.
+
+        tArea: Desired area of each centered rectangle.
+        height: Maximum height of scanning area.
+        width: Maximum width of scanning area.
+        plane, offset, margin, refine: See *grid_points*.
+        verbose: Print the rectangle area and point count.
+        """
+
+    margin_w, margin_h = _margins(margin)
+    H = height - 2.0*margin_h
+    W = width - 2.0*margin_w
+
+    Hb_1st = np.sqrt(float(tArea))
+    N_H = max(1, int(H/Hb_1st))
+    Hb = float(H)/N_H
+
+    Wb_1st = tArea/Hb
+    N_W = max(1, int(W/Wb_1st))
+    Wb = float(W)/N_W
+
+    points = grid_points(N_W, N_H, height, width, plane, offset, margin, refine)
+
+    if verbose:
+        print("Area: {} mm\n".format(Hb*Wb))
+        print("Points: {} \n".format(len(points)))
+
+    return points
+
+def get_scan_points_count(tCount,height,width,plane="XZ",offset=0.0,margin=0.0,refine=None,verbose=True):
+    """Creates an (N,3) array of [x,y,z] points with points equally spaced across given height and width.
+        Total count of points will be close to tCount.
+
+        tCount: Desired total count of points, split between width and height so the rectangles are close to
+            square. Alternatively an exact [width count, height count].
+        height: Maximum height of scanning area.
+        width: Maximum width of scanning area.
+        plane, offset, margin, refine: See *grid_points*.
+        verbose: Print the rectangle area and point count.
+        """
+
+    margin_w, margin_h = _margins(margin)
+    H = height - 2.0*margin_h
+    W = width - 2.0*margin_w
+
+    if np.isscalar(tCount):
+        N_H = max(1, int(round(np.sqrt(tCount*H/W))))
+        N_W = max(1, int(round(tCount/float(N_H))))
+    else:
+        N_W, N_H = int(tCount[0]), int(tCount[1])
+
+    Hb = float(H)/N_H
+    Wb = float(W)/N_W
+
+    points = grid_points(N_W, N_H, height, width, plane, offset, margin, refine)
+
+    if verbose:
+        print("Area: {} mm\n".format(Hb*Wb))
+        print("Points: {} \n".format(len(points)))
+
+    return points
@@ -0,0 +1,239 @@
+import time
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+DEFAULT_SPEEDS = (6000.0, 6000.0, 200.0)
+
+def _scaled(points, speeds):
+    """Returns **points** divided by the per-axis speeds, so distances between rows are travel times in seconds."""
+
+    return np.asarray(points, dtype=float).reshape(-1, 3) * (60.0 / np.asarray(speeds, dtype=float))
+
+def segment_times(points, speeds=DEFAULT_SPEEDS, start=(0.0, 0.0, 0.0), combined=True):
+    """Returns the estimated time in seconds of every move when visiting **points** in order.
+
+    points: Array-like of [x,y,z] points in mm.
+    speeds: Per-axis speeds [xSpeed,ySpeed,zSpeed] in mm/min.
+    start: Position the traverse starts from. If None, the first point is the start and its move takes no time.
+    combined: True if all axes move together (Printer.combinedMoves), so a move lasts as long as its slowest axis.
+        False if the axes move one after another, so the axis times add up.
+    """
+
+    scaled = _scaled(points, speeds)
+    if start is not None:
+        scaled = np.vstack([_scaled(start, speeds), scaled])
+    steps = np.abs(np.diff(scaled, axis=0))
+    times = steps.max(axis=1) if combined else steps.sum(axis=1)
+    return times if start is not None else np.concatenate([[0.0], times])
+
+def estimate_travel_time(points, speeds=DEFAULT_SPEEDS, start=(0.0, 0.0, 0.0), combined=True):
+    """Returns the estimated total travel time in seconds of visiting **points** in order. See *segment_times*."""
+
+    if len(points) == 0:
+        return 0.0
+    return float(segment_times(points, speeds, start, combined).sum())
+
+def order_serpentine(points, speeds=DEFAULT_SPEEDS, axis=None, start=(0.0, 0.0, 0.0), combined=True, tol=1e-6):
+    """Returns the indices that visit **points** as a serpentine (boustrophedon) raster.
+
+    Points sharing the other two coordinates form a line that is swept along *axis*, alternating direction from one
+    line to the next, so the carriage never travels back to the start of a line.
+
+    axis: Index of the sweep axis (0=x, 1=y, 2=z). If none given, every axis is tried and the fastest path kept.
+    tol: Distance in mm below which coordinates are considered to be on the same line.
+    """
+
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if axis is None:
+        candidates = [order_serpentine(points, speeds, ax, start, combined, tol) for ax in range(3)]
+        times = [estimate_travel_time(points[order], speeds, start, combined) for order in candidates]
+        return candidates[int(np.argmin(times))]
+
+    others = [ax for ax in np.argsort(speeds) if ax != axis] # Slowest axis steps least often.
+    keys = np.round(points[:, others] / tol).astype(np.int64)
+    _, line = np.unique(keys, axis=0, return_inverse=True)
+    line = line.ravel()
+    direction = np.where(line % 2 == 0, 1.0, -1.0)
+    return np.lexsort((direction * points[:, axis], line))
+
+def order_nearest_neighbour(points, speeds=DEFAULT_SPEEDS, start=(0.0, 0.0, 0.0), combined=True):
+    """Returns the indices that visit **points** by always moving to the closest (in time) unvisited point.
+
+    Uses a KD-tree when SciPy is available, which handles tens of thousands of points in seconds.
+    """
+
+    scaled = _scaled(points, speeds)
+    n = len(scaled)
+    p = np.inf if combined else 1
+    current = scaled[0] if start is None else _scaled(start, speeds)[0]
+    remaining = np.ones(n, dtype=bool)
+    order = np.empty(n, dtype=np.int64)
+
+    if cKDTree is None:
+        for step in range(n):
+            ids = np.flatnonzero(remaining)
+            steps = np.abs(scaled[ids] - current)
+            dists = steps.max(axis=1) if combined else steps.sum(axis=1)
+            choice = ids[np.argmin(dists)]
+            order[step] = choice
+            remaining[choice] = False
+            current = scaled[choice]
+        return order
+
+    ids = np.arange(n)
+    tree = cKDTree(scaled)
+    used = 0 # Points of the current tree already visited.
+    for step in range(n):
+        k = 8
+        while True:
+            k = min(k, len(ids))
+            _, idx = tree.query(current, k=k, p=p)
+            candidates = ids[np.atleast_1d(idx)]
+            free = remaining[candidates]
+            if free.any() or k == len(ids):
+                break
+            k *= 4
+        choice = candidates[np.argmax(free)]
+        order[step] = choice
+        remaining[choice] = False
+        current = scaled[choice]
+
+        used += 1
+        if used > len(ids) // 2 and len(ids) > 64:
+            ids = np.flatnonzero(remaining)
+            tree = cKDTree(scaled[ids])
+            used = 0
+    return order
+
+def _neighbour_lists(scaled, count, combined):
+    """Returns the indices of the **count** nearest points of every point (excluding itself)."""
+
+    count = min(count, len(scaled) - 1)
+    if cKDTree is not None:
+        _, idx = cKDTree(scaled).query(scaled, k=count + 1, p=np.inf if combined else 1)
+        return idx[:, 1:]
+
+    neighbours = np.empty((len(scaled), count), dtype=np.int64)
+    for lo in range(0, len(scaled), 1024):
+        steps = np.abs(scaled[lo:lo + 1024, None, :] - scaled[None, :, :])
+        dists = steps.max(axis=2) if combined else steps.sum(axis=2)
+        dists[np.arange(len(dists)), np.arange(lo, lo + len(dists))] = np.inf
+        near = np.argpartition(dists, count - 1, axis=1)[:, :count]
+        neighbours[lo:lo + 1024] = np.take_along_axis(near, np.argsort(np.take_along_axis(dists, near, 1), 1), 1)
+    return neighbours
+
+def improve_two_opt(points, order, speeds=DEFAULT_SPEEDS, start=(0.0, 0.0, 0.0), combined=True, neighbours=8,
+                    max_passes=5, time_limit=None):
+    """Improves a visiting **order** of **points** with 2-opt moves and returns the new order.
+
+    Only reconnections to each point's *neighbours* nearest points are tried, which keeps every pass close to
+    linear in the number of points. The start position stays fixed and the end of the path is free.
+
+    max_passes: Maximum number of passes over all points. Stops early once a pass finds no improvement.
+    time_limit: Seconds after which the search stops with the best order found so far.
+    """
+
+    scaled = _scaled(points, speeds)
+    n = len(scaled)
+    if n < 3:
+        return np.asarray(order)
+    if start is None:
+        start = np.asarray(points, dtype=float).reshape(-1, 3)[order[0]]
+
+    # Node n is the fixed start position.
+    coords = np.vstack([scaled, _scaled(start, speeds)]).tolist()
+    route = np.concatenate([[n], order]).astype(np.int64)
+    pos = np.empty(n + 1, dtype=np.int64)
+    pos[route] = np.arange(n + 1)
+    near = _neighbour_lists(scaled, neighbours, combined).tolist()
+    last = n
+
+    def dist(u, v):
+        if u is None or v is None:
+            return 0.0
+        a = coords[u]
+        b = coords[v]
+        if combined:
+            return max(abs(a[0] - b[0]), abs(a[1] - b[1]), abs(a[2] - b[2]))
+        return abs(a[0] - b[0]) + abs(a[1] - b[1]) + abs(a[2] - b[2])
+
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    for _ in range(max_passes):
+        improved = False
+        for a in range(n):
+            i = int(pos[a])
+            b = int(route[i + 1]) if i < last else None
+            for c in near[a]:
+                j = int(pos[c])
+                if j > i + 1:
+                    # Edges (a,b) and (c,d) become (a,c) and (b,d).
+                    d = int(route[j + 1]) if j < last else None
+                    if dist(a, c) + dist(b, d) < dist(a, b) + dist(c, d) - 1e-9:
+                        lo, hi = i + 1, j
+                    else:
+                        continue
+                elif j < i - 1:
+                    # Edges (c,d) and (a,b) become (c,a) and (d,b).
+                    d = int(route[j + 1])
+                    if dist(c, a) + dist(d, b) < dist(c, d) + dist(a, b) - 1e-9:
+                        lo, hi = j + 1, i
+                    else:
+                        continue
+                else:
+                    continue
+                route[lo:hi + 1] = route[lo:hi + 1][::-1].copy()
+                pos[route[lo:hi + 1]] = np.arange(lo, hi + 1)
+                improved = True
+                i = int(pos[a])
+                b = int(route[i + 1]) if i < last else None
+            if deadline is not None and time.monotonic() > deadline:
+                return route[1:]
+        if not improved:
+            break
+    return route[1:]
+
+def plan_scan_path(points, speeds=DEFAULT_SPEEDS, method="nearest", start=(0.0, 0.0, 0.0), combined=True,
+                   verbose=True, **kwargs):
+    """Reorders **points** to minimise the estimated traverse time and reports the time before and after.
+
+    points: Array-like of [x,y,z] points in mm.
+    speeds: Per-axis speeds [xSpeed,ySpeed,zSpeed] in mm/min.
+    method: "none" keeps the given order, "serpentine" sweeps lines back and forth, "nearest" builds a
+        nearest-neighbour path and improves it with 2-opt, "auto" keeps the fastest of "serpentine" and "nearest".
+    start: Position the traverse starts from, usually the printer's current position.
+    combined: True if all axes move together (Printer.combinedMoves). See *segment_times*.
+    verbose: Print the estimated traverse times.
+    kwargs: Passed on to *improve_two_opt* (neighbours, max_passes, time_limit).
+
+    Returns the reordered (N,3) point array, the estimated time before and the estimated time after in seconds.
+    """
+
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    before = estimate_travel_time(points, speeds, start, combined)
+
+    if method == "none" or len(points) < 2:
+        order = np.arange(len(points))
+    elif method == "serpentine":
+        order = order_serpentine(points, speeds, start=start, combined=combined)
+    elif method == "nearest":
+        order = order_nearest_neighbour(points, speeds, start, combined)
+        order = improve_two_opt(points, order, speeds, start, combined, **kwargs)
+    elif method == "auto":
+        candidates = [order_serpentine(points, speeds, start=start, combined=combined),
+                      improve_two_opt(points, order_nearest_neighbour(points, speeds, start, combined), speeds,
+                                      start, combined, **kwargs)]
+        times = [estimate_travel_time(points[order], speeds, start, combined) for order in candidates]
+        order = candidates[int(np.argmin(times))]
+    else:
+        raise ValueError("Unknown path method: {}".format(method))
+
+    ordered = points[order]
+    after = estimate_travel_time(ordered, speeds, start, combined)
+    if verbose:
+        print("Estimated traverse time: {:.1f} s before, {:.1f} s after reordering ({}).\n".format(before, after,
+                                                                                                  method))
+    return ordered, before, after
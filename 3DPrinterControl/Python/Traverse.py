@@ -0,0 +1,41 @@
+"""Traverses a **Printer** through a list of points. Shared by the 3DPrinterControl script, AdaptiveScan and
+TraverseBenchmark.
+"""
+
+import numpy as np
+from ScanPath import plan_scan_path
+
+def run_points(printer,points_list,order=None,progress=None,stop=None):
+    """Runs the given **printer** through the list of points **points_list**.
+
+    printer: 3D printer defined as object **Printer**.
+    points_list: Points to traverse through. Each point defined as [x,y,z]. Any iterable works, including
+        generators and **PointSource**, which are consumed lazily as the printer moves.
+    order: If given, the points are first reordered to minimise the estimated traverse time using the printer's
+        speeds. One of "serpentine", "nearest" or "auto" (see ScanPath.plan_scan_path). This reads all points
+        before the first move.
+    progress: Function called with each point once the printer has reached it. When traversing a **PointSource**,
+        its checkpoint() at that moment gives the start and offset to resume from after an interruption.
+    stop: Function called after each point. The traverse ends early, leaving the printer where it is, once it
+        returns True (e.g. OnlineReduction.stopped to abort a bad run).
+
+    Returns the number of points traversed.
+    """
+
+    if order is not None:
+        points_list = np.asarray(list(points_list), dtype=float)
+        points_list, _, _ = plan_scan_path(points_list, [printer.xSpeed, printer.ySpeed, printer.zSpeed], order,
+                                           [printer.x, printer.y, printer.z], printer.combinedMoves)
+
+    count = 0
+    for point in points_list:
+        printer.moveTo(point[0],point[1],point[2])
+        count += 1
+        if getattr(printer, "tracer", None) is not None:
+            printer.tracer.point(point)
+        if progress is not None:
+            progress(point)
+        if stop is not None and stop():
+            print("Traverse stopped after {} points.".format(count))
+            break
+    return count
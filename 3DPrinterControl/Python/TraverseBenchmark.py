@@ -0,0 +1,114 @@
+"""Benchmarks traverses of representative scan plans through **Printer** against the simulated printer.
+
+Every combination of scan plan, point count and sender mode is run through run_points() on a MarlinSimulator, and
+the results are written as JSON so they can be compared between releases. All times except wall_time_s are
+simulated seconds.
+
+    python TraverseBenchmark.py --sizes 100 1000 --output bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import time
+
+import numpy as np
+
+from Printer import Printer
+from PrinterSimulator import MarlinSimulator
+from ScanGrid import get_scan_points_count
+from ScanPath import order_serpentine
+from Traverse import run_points
+
+PLANS = ("raster", "serpentine", "random")
+MODES = {
+    "sleep": dict(),
+    "streaming": dict(streaming=True),
+    "combined": dict(streaming=True, combinedMoves=True, maxInFlight=8),
+}
+
+def scan_plan(plan, count, size=200.0, seed=0):
+    """Returns the (N,3) points of a **plan** with about **count** points over a **size** mm square XZ area.
+
+    plan: "raster" (column by column, as the scan generators produce), "serpentine" or "random" order.
+    """
+
+    points = get_scan_points_count(count, size, size, verbose=False)
+    if plan == "serpentine":
+        points = points[order_serpentine(points)]
+    elif plan == "random":
+        points = points[np.random.default_rng(seed).permutation(len(points))]
+    elif plan != "raster":
+        raise ValueError("Unknown scan plan: {}".format(plan))
+    return points
+
+def run_benchmark(plan, count, mode, seed=0):
+    """Traverses one scan plan with one sender mode and returns its measurements as a dict."""
+
+    points = scan_plan(plan, count, seed=seed)
+    sim = MarlinSimulator()
+    with contextlib.redirect_stdout(io.StringIO()):
+        printer = Printer(transport=sim, **MODES[mode])
+
+    clock = sim.clock
+    start = [clock.now(), clock.slept, clock.blocked, sim.bytes_received, sim.lines_received, sim.motion_time]
+    wall = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_points(printer, points)
+    wall = time.perf_counter() - wall
+
+    traverse = clock.now() - start[0]
+    motion = sim.motion_time - start[5]
+    return {
+        "plan": plan,
+        "mode": mode,
+        "points": len(points),
+        "traverse_time_s": traverse,
+        "points_per_s": len(points)/traverse if traverse else None,
+        "wall_time_s": wall,
+        "motion_time_s": motion,
+        "idle_time_per_point_s": (traverse - motion)/len(points),
+        "bytes_sent": sim.bytes_received - start[3],
+        "commands_per_point": (sim.lines_received - start[4])/float(len(points)),
+        "sleep_fraction": (clock.slept - start[1])/traverse if traverse else 0.0,
+        "blocked_fraction": (clock.blocked - start[2])/traverse if traverse else 0.0,
+    }
+
+def run_suite(sizes=(100, 1000, 10000), plans=PLANS, modes=tuple(MODES), seed=0, verbose=True):
+    """Runs every combination of **sizes**, **plans** and **modes**. Returns the JSON-ready report."""
+
+    results = []
+    for count in sizes:
+        for plan in plans:
+            for mode in modes:
+                result = run_benchmark(plan, count, mode, seed)
+                results.append(result)
+                if verbose:
+                    print("{plan:>10} {mode:>9} {points:>6} points: {points_per_s:8.2f} points/s, "
+                          "{traverse_time_s:9.1f} s, {commands_per_point:.1f} commands/point, "
+                          "{sleep_fraction:.0%} sleeping".format(**result))
+    return {
+        "benchmark": "traverse",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "seed": seed,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark printer traverses against the simulated printer.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--plans", nargs="+", choices=PLANS, default=list(PLANS))
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file to write. Printed to stdout if not given.")
+    args = parser.parse_args()
+
+    report = run_suite(args.sizes, args.plans, args.modes, args.seed, verbose=args.output is not None)
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,122 @@
+"""Reduces many results files against one calibration on all cores.
+
+The calibration is compiled once into a memory-mapped cache (see CalibrationCache) and every worker process loads it
+from there when it starts, so the tables are shared through the page cache instead of being pickled per file. A
+failing file is reported and skipped without stopping the others. Its _Results.csv from an earlier run, if any, is
+kept untouched.
+
+    python BatchProcessing.py Condensed_FCalibData.csv "E:/Results/*.csv" --pref 14.5 --density 0.002297145
+"""
+
+import argparse
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from CalibrationCache import default_cache_path
+from FiveHoleProbe_CalibrationAndProcessing import CalibData, process_results_file
+
+_calib_data = None # Calibration of the current worker process.
+
+def _init_worker(cache_path):
+    global _calib_data
+    _calib_data = CalibData.from_cache(cache_path)
+
+def _remove_partial_output(results_filename):
+    """Removes the temporary output of a failed file. process_results_file() only replaces the _Results.csv once a
+    file is fully reduced, so an output from an earlier run is kept."""
+
+    out_filename = os.path.splitext(results_filename)[0] + "_Results.csv"
+    if os.path.exists(out_filename + ".tmp"):
+        os.remove(out_filename + ".tmp")
+    if os.path.exists(out_filename):
+        print("{}: keeping the earlier {}".format(results_filename, out_filename))
+
+def _process_file(results_filename, Pref, density, sensors=None):
+    """Reduces and writes one results file in a worker. Returns [filename,point count,seconds,error or None]."""
+
+    start = time.perf_counter()
+    try:
+        count = process_results_file(results_filename, _calib_data, Pref, density, sensors=sensors)
+        return [results_filename, count, time.perf_counter() - start, None]
+    except Exception:
+        _remove_partial_output(results_filename)
+        return [results_filename, 0, time.perf_counter() - start, traceback.format_exc()]
+
+def _same_file(filename, others):
+    return any(os.path.exists(other) and os.path.samefile(filename, other) for other in others)
+
+def find_results_files(pattern, exclude=()):
+    """Returns the sorted results files matching a directory or glob **pattern**, skipping written *_Results.csv files.
+
+    exclude: Other files to skip, e.g. the calibration csv kept in the same directory as the results.
+    """
+
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.csv")
+    return sorted(filename for filename in glob.glob(pattern)
+                  if not filename.endswith("_Results.csv") and not _same_file(filename, exclude))
+
+def process_files(pattern, calib_filename, Pref, density, max_workers=None, cache=None, verbose=True, sensors=None):
+    """Reduces every results file matching **pattern** (a directory, a glob or a list of files) in parallel.
+
+    pattern: Directory, glob pattern or list of results files. The calibration csv is skipped if it matches.
+    calib_filename: Condensed calibration csv shared by all files.
+    Pref: Reference pressure (psia).
+    density: Density of the flow.
+    max_workers: Number of worker processes. Defaults to the number of cores.
+    cache: Calibration cache directory. Defaults to the one next to the calibration csv.
+    verbose: Print a line per finished file.
+    sensors: SensorArray (see SensorModels) used for every file. Defaults to 30 psi, 5 V transducers.
+
+    Returns a list of [filename,point count,seconds,error or None] in completion order.
+    """
+
+    if isinstance(pattern, (list, tuple)):
+        files = [filename for filename in pattern if not _same_file(filename, [calib_filename])]
+    else:
+        files = find_results_files(pattern, [calib_filename])
+    cache = default_cache_path(calib_filename) if cache is None else cache
+    CalibData(calib_filename, cache=cache) # Compile the shared cache once, before the workers start.
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(cache,)) as pool:
+        futures = {pool.submit(_process_file, filename, Pref, density, sensors): filename for filename in files}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                result = future.result()
+            except Exception:
+                # The worker itself died, e.g. killed mid-file.
+                _remove_partial_output(futures[future])
+                result = [futures[future], 0, 0.0, traceback.format_exc()]
+            results.append(result)
+
+            if verbose:
+                filename, count, seconds, error = result
+                status = "FAILED" if error else "{} points in {:.2f} s".format(count, seconds)
+                print("[{}/{}] {}: {}".format(done, len(files), filename, status))
+                if error:
+                    print(error)
+
+    if verbose:
+        failed = sum(1 for result in results if result[3])
+        points = sum(result[1] for result in results)
+        print("Reduced {} points from {} files in {:.1f} s ({} failed).".format(points, len(files) - failed,
+                                                                              time.perf_counter() - start, failed))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reduce many five hole probe results files in parallel.")
+    parser.add_argument("calib_filename", help="Condensed calibration csv.")
+    parser.add_argument("pattern", help="Directory or glob pattern of results files.")
+    parser.add_argument("--pref", type=float, default=14.5, help="Reference pressure (psia).")
+    parser.add_argument("--density", type=float, default=0.002297145, help="Density (slugs/ft^3).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. Defaults to the core count.")
+    parser.add_argument("--cache", default=None, help="Calibration cache directory.")
+    args = parser.parse_args()
+
+    results = process_files(args.pattern, args.calib_filename, args.pref, args.density, args.workers, args.cache)
+    raise SystemExit(1 if any(result[3] for result in results) else 0)
@@ -0,0 +1,105 @@
+"""Compiled calibration cache for CalibData.
+
+A compiled calibration is a directory holding a data-* subdirectory with one .npy file per CalibData array (grid,
+inverse table and raw points) and a meta.json naming that subdirectory. Every write goes to a new subdirectory and is
+published by replacing meta.json, so a process that has the previous arrays memory-mapped keeps reading intact files
+while the cache is recompiled. The arrays are loaded with memory-mapping, so loading is near-instant and worker
+processes reading the same cache share one copy of the tables in the page cache. The cache is keyed by a hash of the
+source csv and the build options, so it is rebuilt whenever the calibration changes.
+
+    python CalibrationCache.py Condensed_FCalibData.csv
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+CACHE_VERSION = 2
+ARRAYS = ("points", "counts", "yaws", "pitches", "cp_yaw", "cp_pitch", "cp_static", "cp_total",
+          "inverse_cp_yaws", "inverse_cp_pitches", "inverse_table")
+
+def default_cache_path(calib_filename):
+    """Returns the cache directory used for **calib_filename** when none is given."""
+
+    return os.path.splitext(calib_filename)[0] + ".calibcache"
+
+def cache_key(calib_filename, inverse_resolution, duplicates):
+    """Returns the key identifying a compiled calibration: a hash of the source csv and the build options."""
+
+    digest = hashlib.sha256()
+    with open(calib_filename, 'rb') as calib_file:
+        for block in iter(lambda: calib_file.read(1 << 20), b""):
+            digest.update(block)
+    return "{}-{}-{}-{}".format(CACHE_VERSION, digest.hexdigest(), int(inverse_resolution), duplicates)
+
+def _read_meta(cache_path):
+    try:
+        with open(os.path.join(cache_path, "meta.json")) as meta_file:
+            return json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+
+def write_cache(calib_data, cache_path, key):
+    """Writes the arrays of **calib_data** to **cache_path** under **key**.
+
+    Existing files are never rewritten in place: the arrays go to a new data-* subdirectory, meta.json is replaced to
+    point at it, and only then is the previous subdirectory removed. Processes that still map the previous arrays keep
+    their data: POSIX keeps removed files alive while mapped, and Windows refuses the removal, leaving the old
+    subdirectory behind.
+    """
+
+    os.makedirs(cache_path, exist_ok=True)
+    data_path = tempfile.mkdtemp(prefix="data-", dir=cache_path)
+    for name in ARRAYS:
+        np.save(os.path.join(data_path, name + ".npy"), np.ascontiguousarray(getattr(calib_data, name)))
+
+    previous = _read_meta(cache_path)
+    meta_filename = os.path.join(cache_path, "meta.json")
+    meta_tmp = "{}.{}.tmp".format(meta_filename, os.getpid())
+    with open(meta_tmp, 'w') as meta_file:
+        json.dump({"version": CACHE_VERSION, "key": key, "data": os.path.basename(data_path)}, meta_file)
+    os.replace(meta_tmp, meta_filename)
+
+    # Only the arrays of the cache just replaced, and of version 1 caches, are removed. Other unpublished data-*
+    # directories may belong to a write still in progress.
+    if previous is not None and previous.get("data"):
+        shutil.rmtree(os.path.join(cache_path, previous["data"]), ignore_errors=True)
+    for name in ARRAYS:
+        try:
+            os.remove(os.path.join(cache_path, name + ".npy"))
+        except OSError:
+            pass
+
+def read_cache(cache_path, key=None):
+    """Returns a dict of memory-mapped arrays from **cache_path**, or None if there is no valid cache.
+
+    key: If given, the cache is only used if it was written under this key.
+    """
+
+    meta = _read_meta(cache_path)
+    if meta is None or meta.get("version") != CACHE_VERSION or (key is not None and meta.get("key") != key):
+        return None
+
+    data_path = os.path.join(cache_path, meta["data"])
+    try:
+        return {name: np.load(os.path.join(data_path, name + ".npy"), mmap_mode='r') for name in ARRAYS}
+    except (OSError, ValueError):
+        return None
+
+if __name__ == "__main__":
+    import argparse
+    from FiveHoleProbe_CalibrationAndProcessing import CalibData
+
+    parser = argparse.ArgumentParser(description="Compile a condensed calibration csv into a calibration cache.")
+    parser.add_argument("calib_filename")
+    parser.add_argument("--cache", help="Cache directory. Defaults to the csv name with a .calibcache extension.")
+    parser.add_argument("--inverse-resolution", type=int, default=201)
+    parser.add_argument("--duplicates", choices=["mean", "first", "last"], default="mean")
+    args = parser.parse_args()
+
+    CalibData(args.calib_filename, args.inverse_resolution, args.duplicates, cache=args.cache or True)
+    print("Compiled calibration written to {}".format(args.cache or default_cache_path(args.calib_filename)))
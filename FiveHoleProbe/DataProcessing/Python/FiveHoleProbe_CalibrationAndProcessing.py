@@ -1,7 +1,11 @@
 #from scipy.interpolate import spline
+import itertools
 import os
+import warnings
 import numpy as np
-import matplotlib.pyplot as plt
+from CalibrationCache import cache_key, default_cache_path, read_cache, write_cache
+from ScatteredInversion import ScatteredInversion
+from ResultsWriters import CSV_HEADER, csv_table, plot_results, write_csv_rows, write_results
 
 def lin_interp(indeps,deps,spec_indep):
     for ind,indep in enumerate(indeps):
@@ -10,6 +14,80 @@ def lin_interp(indeps,deps,spec_indep):
             high_indep = indeps[ind+1]
             return deps[ind] + (spec_indep-indep)*((deps[ind+1]-deps[ind])/(high_indep-low_indep))
 
+def interp_line(indeps,deps,spec_indeps):
+    """Interpolates a single calibration line at every value of **spec_indeps** at once.
+
+    NaN knots (missing calibration points) are skipped and values outside the line give NaN. Monotonic lines use
+    np.interp; other lines fall back to *interp_rows* (first segment containing the value, like lin_interp).
+    """
+
+    indeps = np.asarray(indeps, dtype=float)
+    deps = np.asarray(deps, dtype=float)
+    keep = np.isfinite(indeps) & np.isfinite(deps)
+    indeps = indeps[keep]
+    deps = deps[keep]
+    spec_indeps = np.asarray(spec_indeps, dtype=float)
+    if len(indeps) < 2:
+        return np.full(spec_indeps.shape, np.nan)
+
+    steps = np.diff(indeps)
+    if np.all(steps > 0):
+        return np.interp(spec_indeps, indeps, deps, left=np.nan, right=np.nan)
+    if np.all(steps < 0):
+        return np.interp(spec_indeps, indeps[::-1], deps[::-1], left=np.nan, right=np.nan)
+    return interp_rows(indeps[None, :], deps, spec_indeps)
+
+def interp_rows(indeps,deps,spec_indeps):
+    """Interpolates each value of **spec_indeps** along its own row of knots.
+
+    indeps: (M,K) knots, one row per value. Rows need not be sorted; NaN knots are skipped.
+    deps: (K,) values shared by all rows, or (M,K).
+    spec_indeps: (M,) values to interpolate.
+
+    Like lin_interp, the first segment containing the value is used. Values outside every segment give NaN.
+    """
+
+    indeps = np.asarray(indeps, dtype=float)
+    deps = np.broadcast_to(np.asarray(deps, dtype=float), indeps.shape)
+    spec = np.asarray(spec_indeps, dtype=float)[:, None]
+
+    low = indeps[:, :-1]
+    high = indeps[:, 1:]
+    inside = ((spec >= low) & (spec <= high)) | ((spec <= low) & (spec >= high))
+    inside &= np.isfinite(deps[:, :-1]) & np.isfinite(deps[:, 1:])
+    seg = inside.argmax(axis=1)[:, None]
+
+    x0 = np.take_along_axis(low, seg, 1)[:, 0]
+    x1 = np.take_along_axis(high, seg, 1)[:, 0]
+    y0 = np.take_along_axis(deps[:, :-1], seg, 1)[:, 0]
+    y1 = np.take_along_axis(deps[:, 1:], seg, 1)[:, 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(x1 != x0, (spec[:, 0] - x0)/(x1 - x0), 0.0)
+    return np.where(inside.any(axis=1), y0 + frac*(y1 - y0), np.nan)
+
+def bilinear(xs,ys,table,spec_xs,spec_ys):
+    """Bilinear interpolation on a regular grid.
+
+    xs: (X,) sorted grid values of the first axis.
+    ys: (Y,) sorted grid values of the second axis.
+    table: (...,X,Y) values on the grid. Any leading axes are interpolated together.
+    spec_xs, spec_ys: (M,) points to interpolate.
+
+    Returns (...,M) values. Points outside the grid, or next to a NaN grid value, give NaN.
+    """
+
+    spec_xs = np.asarray(spec_xs, dtype=float)
+    spec_ys = np.asarray(spec_ys, dtype=float)
+    i = np.clip(np.searchsorted(xs, spec_xs) - 1, 0, len(xs) - 2)
+    j = np.clip(np.searchsorted(ys, spec_ys) - 1, 0, len(ys) - 2)
+    tx = (spec_xs - xs[i])/(xs[i + 1] - xs[i])
+    ty = (spec_ys - ys[j])/(ys[j + 1] - ys[j])
+    outside = (tx < 0) | (tx > 1) | (ty < 0) | (ty > 1) | ~np.isfinite(tx) | ~np.isfinite(ty)
+
+    values = (table[..., i, j]*(1 - tx)*(1 - ty) + table[..., i + 1, j]*tx*(1 - ty) +
+              table[..., i, j + 1]*(1 - tx)*ty + table[..., i + 1, j + 1]*tx*ty)
+    return np.where(outside, np.nan, values)
+
 class CalibPoint:
 
     def __init__(self,yaw,pitch,cp_yaw,cp_pitch,cp_static,cp_total):
@@ -21,218 +99,472 @@ class CalibPoint:
         self.cp_total = cp_total
 
 class CalibData:
-
-    def __init__(self,calib_filename):
-
-        with open(calib_filename) as calib_file:
-            cond_calib_lines = calib_file.readlines()
-            cond_calib_lines.pop(0)  # Remove header line.
-            cond_calib_lines = [line.split(',') for line in cond_calib_lines]
-
-            calib_points = [CalibPoint(float(line[1]), float(line[0]), float(line[2]), float(line[3]), float(line[4]), \
-                                       float(line[5])) for line in cond_calib_lines]
-
-        yaws = [point.yaw for point in calib_points]
-        pitches = [point.pitch for point in calib_points]
-
-        yaws_u = list(set(yaws))
-        yaws_u.sort()
-        pitches_u = list(set(pitches))
-        pitches_u.sort()
-
-        yaw_lines = {}
-        for yaw in yaws_u:
-            yaw_lines[yaw] = {}
-            for pitch in pitches_u:
-                for point in calib_points:
-                    if point.yaw == yaw and point.pitch == pitch:
-                        yaw_lines[yaw][pitch] = point
-        self.yaw_lines = yaw_lines
-
-        pitch_lines = {}
-        for pitch in pitches_u:
-            pitch_lines[pitch] = {}
-            for yaw in yaws_u:
-                for point in calib_points:
-                    if point.pitch == pitch and point.yaw == yaw:
-                        pitch_lines[pitch][yaw] = point
-        self.pitch_lines = pitch_lines
+    """Five hole probe calibration read from a condensed calibration csv (pitch,yaw,cp_yaw,cp_pitch,cp_static,cp_total).
+
+    The calibration is bucketed in a single pass into sorted arrays on the (yaw, pitch) grid (yaws, pitches and the
+    (Y,P) grids cp_yaw, cp_pitch, cp_static, cp_total; NaN where a point is missing) and an inverse table from
+    (cp_yaw, cp_pitch) to (yaw, pitch, cp_static, cp_total) is precomputed on a regular inverse_resolution by
+    inverse_resolution grid. *lookup()* then only needs searchsorted and bilinear steps.
+
+        calib_filename: Condensed calibration csv. The header line is skipped.
+        inverse_resolution: Size of the inverse table along each axis.
+        duplicates: How repeated (yaw, pitch) points are combined on the grid: "mean", "first" or "last".
+            All raw points, repeats included, are kept in *points*, and *counts* holds the repeats per cell.
+        cache: If True (or a directory path), the compiled calibration is loaded memory-mapped from a cache next to
+            the csv (or at that path) when it matches the csv and options, and written there otherwise. See
+            CalibrationCache.
+        inversion: "grid" for the grid inversion above, or "scattered" to invert by triangulating the raw points in
+            (cp_yaw, cp_pitch) space (see ScatteredInversion), for calibrations with missing points or irregular
+            steps. The grid arrays are not built for "scattered" and it cannot be cached.
+        extrapolate: With "scattered" inversion, extrapolate points outside the calibration from their nearest
+            calibration points instead of giving NaN. They are flagged either way (see *lookup()*).
+    """
+
+    def __init__(self,calib_filename,inverse_resolution=201,duplicates="mean",cache=False,inversion="grid",
+                 extrapolate=False):
+
+        if inversion not in ("grid", "scattered"):
+            raise ValueError("Unknown inversion: {}".format(inversion))
+        if cache and inversion == "scattered":
+            raise ValueError("The calibration cache only holds the grid inversion.")
+        if cache:
+            cache_path = default_cache_path(calib_filename) if cache is True else cache
+            key = cache_key(calib_filename, inverse_resolution, duplicates)
+            arrays = read_cache(cache_path, key)
+            if arrays is not None:
+                self._load_arrays(arrays)
+                self.set_inversion(inversion, extrapolate)
+                return
+
+        cond_calib = np.loadtxt(calib_filename, delimiter=',', skiprows=1, usecols=range(6), ndmin=2)
+        # Columns: yaw, pitch, cp_yaw, cp_pitch, cp_static, cp_total.
+        self.points = cond_calib[:, [1, 0, 2, 3, 4, 5]]
+        if inversion == "scattered":
+            self.set_inversion(inversion, extrapolate)
+            return
+
+        self.build_grid(duplicates)
+        self.build_inverse(inverse_resolution)
+        self.set_inversion(inversion, extrapolate)
+
+        if cache:
+            write_cache(self, cache_path, key)
+
+    @classmethod
+    def from_cache(cls,cache_path,inversion="grid",extrapolate=False):
+        """Loads a compiled calibration from **cache_path** without checking it against its source csv."""
+
+        arrays = read_cache(cache_path)
+        if arrays is None:
+            raise IOError("No compiled calibration found at {}".format(cache_path))
+        calib_data = cls.__new__(cls)
+        calib_data._load_arrays(arrays)
+        calib_data.set_inversion(inversion, extrapolate)
+        return calib_data
+
+    def set_inversion(self,inversion="grid",extrapolate=False):
+        """Selects the inversion used by *lookup()*: "grid" or "scattered" (see the class docstring)."""
+
+        if inversion == "scattered":
+            self.scattered = ScatteredInversion(self.points, extrapolate)
+        elif inversion == "grid":
+            self.scattered = None
+        else:
+            raise ValueError("Unknown inversion: {}".format(inversion))
+
+    def _load_arrays(self,arrays):
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.missing = [(self.yaws[i], self.pitches[j]) for i, j in np.argwhere(self.counts == 0)]
+        self._yaw_lines = None
+        self._pitch_lines = None
+
+    def build_grid(self,duplicates="mean"):
+        """Buckets *points* into the (yaw, pitch) grid in one pass and reports missing grid points."""
+
+        self.yaws, i_yaw = np.unique(self.points[:, 0], return_inverse=True)
+        self.pitches, i_pitch = np.unique(self.points[:, 1], return_inverse=True)
+        shape = (len(self.yaws), len(self.pitches))
+        cells = np.ravel_multi_index((i_yaw.ravel(), i_pitch.ravel()), shape)
+        self.counts = np.bincount(cells, minlength=shape[0]*shape[1]).reshape(shape)
+
+        grids = np.full((4, shape[0]*shape[1]), np.nan)
+        if duplicates == "mean":
+            with np.errstate(invalid='ignore'):
+                for ind in range(4):
+                    grids[ind] = np.bincount(cells, self.points[:, ind + 2], grids.shape[1])/self.counts.ravel()
+        elif duplicates in ("first", "last"):
+            order = np.arange(len(cells)) if duplicates == "first" else np.arange(len(cells))[::-1]
+            _, first = np.unique(cells[order], return_index=True)
+            rows = order[first]
+            grids[:, cells[rows]] = self.points[rows, 2:].T
+        else:
+            raise ValueError("Unknown duplicates option: {}".format(duplicates))
+        self.cp_yaw, self.cp_pitch, self.cp_static, self.cp_total = grids.reshape(4, *shape)
+
+        missing = np.argwhere(self.counts == 0)
+        self.missing = [(self.yaws[i], self.pitches[j]) for i, j in missing]
+        if self.missing:
+            print("WARNING: {} of {} calibration grid points missing.".format(len(self.missing), self.counts.size))
+
+        self._yaw_lines = None
+        self._pitch_lines = None
+
+    def _grid_point(self,i_yaw,i_pitch):
+        return CalibPoint(self.yaws[i_yaw], self.pitches[i_pitch], self.cp_yaw[i_yaw, i_pitch],
+                          self.cp_pitch[i_yaw, i_pitch], self.cp_static[i_yaw, i_pitch], self.cp_total[i_yaw, i_pitch])
+
+    @property
+    def yaw_lines(self):
+        """Dict of yaw -> {pitch: CalibPoint} for every calibrated grid point, built on first use."""
+
+        if self._yaw_lines is None:
+            self._yaw_lines = {yaw: {self.pitches[j]: self._grid_point(i, j) for j in range(len(self.pitches))
+                                     if self.counts[i, j]} for i, yaw in enumerate(self.yaws)}
+        return self._yaw_lines
+
+    @property
+    def pitch_lines(self):
+        """Dict of pitch -> {yaw: CalibPoint} for every calibrated grid point, built on first use."""
+
+        if self._pitch_lines is None:
+            self._pitch_lines = {pitch: {self.yaws[i]: self._grid_point(i, j) for i in range(len(self.yaws))
+                                         if self.counts[i, j]} for j, pitch in enumerate(self.pitches)}
+        return self._pitch_lines
+
+    def invert(self,cp_yaw,cp_pitch):
+        """Finds (yaw, pitch, cp_static, cp_total) for arrays of measured **cp_yaw**, **cp_pitch** directly from
+        the calibration grid.
+
+        Yaw is found by interpolating every yaw line at the measured cp_pitch and then interpolating yaw against
+        the resulting cp_yaws; pitch likewise from the pitch lines. cp_static and cp_total are then interpolated
+        bilinearly at (yaw, pitch). Results are NaN outside the calibrated range.
+        """
+
+        cp_yaw = np.atleast_1d(np.asarray(cp_yaw, dtype=float))
+        cp_pitch = np.atleast_1d(np.asarray(cp_pitch, dtype=float))
+
+        line_cp_yaws = np.column_stack([interp_line(self.cp_pitch[i], self.cp_yaw[i], cp_pitch)
+                                        for i in range(len(self.yaws))])
+        yaw = interp_rows(line_cp_yaws, self.yaws, cp_yaw)
+
+        line_cp_pitches = np.column_stack([interp_line(self.cp_yaw[:, j], self.cp_pitch[:, j], cp_yaw)
+                                           for j in range(len(self.pitches))])
+        pitch = interp_rows(line_cp_pitches, self.pitches, cp_pitch)
+
+        cp_static, cp_total = bilinear(self.yaws, self.pitches, np.array([self.cp_static, self.cp_total]), yaw, pitch)
+        return yaw, pitch, cp_static, cp_total
+
+    def build_inverse(self,resolution=201):
+        """Precomputes the inverse table used by *lookup()* on a **resolution** by **resolution** grid spanning
+        the calibrated cp_yaw and cp_pitch ranges."""
+
+        self.inverse_cp_yaws = np.linspace(np.nanmin(self.cp_yaw), np.nanmax(self.cp_yaw), resolution)
+        self.inverse_cp_pitches = np.linspace(np.nanmin(self.cp_pitch), np.nanmax(self.cp_pitch), resolution)
+        cp_yaw, cp_pitch = np.meshgrid(self.inverse_cp_yaws, self.inverse_cp_pitches, indexing='ij')
+        self.inverse_table = np.array(self.invert(cp_yaw.ravel(), cp_pitch.ravel())).reshape(4, resolution,
+                                                                                             resolution)
+
+    def lookup(self,cp_yaw,cp_pitch,flags=False):
+        """Returns arrays (yaw, pitch, cp_static, cp_total) for measured **cp_yaw**, **cp_pitch** (scalars or arrays).
+
+        Interpolates the precomputed inverse table. Points inside the table whose cell touches the edge of the
+        calibrated region are inverted directly (*invert()*). NaN marks points outside the calibration. With the
+        "scattered" inversion, the triangulated calibration points are interpolated instead.
+
+        flags: If True, a fifth array is returned that is True for extrapolated points.
+        """
+
+        cp_yaw = np.atleast_1d(np.asarray(cp_yaw, dtype=float))
+        cp_pitch = np.atleast_1d(np.asarray(cp_pitch, dtype=float))
+        if self.scattered is not None:
+            yaw, pitch, cp_static, cp_total, outside = self.scattered.lookup(cp_yaw, cp_pitch)
+            values = (yaw, pitch, cp_static, cp_total)
+            return values + (outside & np.isfinite(yaw),) if flags else values
+
+        values = bilinear(self.inverse_cp_yaws, self.inverse_cp_pitches, self.inverse_table, cp_yaw, cp_pitch)
+
+        retry = np.isnan(values[0])
+        retry &= (cp_yaw >= self.inverse_cp_yaws[0]) & (cp_yaw <= self.inverse_cp_yaws[-1])
+        retry &= (cp_pitch >= self.inverse_cp_pitches[0]) & (cp_pitch <= self.inverse_cp_pitches[-1])
+        if retry.any():
+            values[:, retry] = self.invert(cp_yaw[retry], cp_pitch[retry])
+        values = tuple(values)
+        return values + (np.zeros(len(cp_yaw), dtype=bool),) if flags else values
+
+    def grid_value(self,grid,yaw,pitch):
+        """Bilinearly interpolates one of the (yaw, pitch) **grid** arrays (e.g. self.cp_static) at **yaw**, **pitch**."""
+
+        return bilinear(self.yaws, self.pitches, grid, np.atleast_1d(yaw), np.atleast_1d(pitch))
+
+# Reason flags of the status column returned by reduce_voltages. A point may have several.
+OUT_OF_CALIBRATION = 1 # cp_yaw, cp_pitch outside the calibration.
+NEGATIVE_DYNAMIC_PRESSURE = 2 # P1 not above the side port average, or total pressure below static.
+REFERENCE_PRESSURE_FAILURE = 4 # A port pressure that is not finite or not above zero absolute.
+EXTRAPOLATED = 8 # Angles and coefficients extrapolated beyond the calibration (CalibData extrapolate option).
+STATUS_NAMES = {
+    OUT_OF_CALIBRATION: "out of calibration",
+    NEGATIVE_DYNAMIC_PRESSURE: "negative dynamic pressure",
+    REFERENCE_PRESSURE_FAILURE: "reference pressure failure",
+    EXTRAPOLATED: "extrapolated",
+}
+STATUS_COMBINATIONS = 16 # Number of distinct status values.
+
+def reduce_voltages(voltages,P_ref,rho,calib_data,x=None,z=None,sensors=None):
+    """Reduces a batch of five hole probe samples with array operations in a single pass.
+
+    voltages: (N,5) transducer voltages of ports 1 to 5.
+    P_ref: Reference pressure (psia) the transducers are relative to.
+    rho: Density of the flow.
+    calib_data: CalibData used to find the flow angles and pressure coefficients.
+    x, z: Optional (N,) traverse coordinates, passed through to the result.
+    sensors: SensorArray (see SensorModels) converting the voltages to pressures. Defaults to 30 psi, 5 V transducers
+        on every port.
+
+    Returns a dict of (N,) arrays: x, z, P1-P5, Pavg, cp_yaw, cp_pitch, yaw, pitch, cp_static, cp_total, Ptotal,
+    Pstatic, vel, Vx, Vy, Vz, status and valid. status holds the reason flags (OUT_OF_CALIBRATION,
+    NEGATIVE_DYNAMIC_PRESSURE, REFERENCE_PRESSURE_FAILURE, EXTRAPOLATED) of every point and valid is status == 0.
+    Points with a reference failure or outside the calibration get zero angles, coefficients, pressures and
+    velocity; points with a negative dynamic pressure get zero velocity. Extrapolated points keep their values.
+    """
+
+    voltages = np.asarray(voltages, dtype=float).reshape(-1, 5)
+    columns = {}
+    if x is not None:
+        columns['x'] = np.asarray(x, dtype=float)
+    if z is not None:
+        columns['z'] = np.asarray(z, dtype=float)
+
+    pressures = voltages*(30.0/5.0) if sensors is None else sensors.convert(voltages)
+    pressures += np.reshape(P_ref, (-1, 1)) if np.ndim(P_ref) else P_ref
+    status = np.zeros(len(voltages), dtype=np.uint8)
+    status[~(np.isfinite(pressures) & (pressures > 0.0)).all(axis=1)] |= REFERENCE_PRESSURE_FAILURE
+    for port in range(5):
+        columns['P{}'.format(port + 1)] = pressures[:, port]
+    P1 = pressures[:, 0]
+    Pavg = pressures[:, 1:].mean(axis=1)
+    columns['Pavg'] = Pavg
+
+    dynamic = P1 - Pavg
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cp_yaw = (pressures[:, 1] - pressures[:, 2])/dynamic
+        cp_pitch = (pressures[:, 3] - pressures[:, 4])/dynamic
+    columns['cp_yaw'] = cp_yaw
+    columns['cp_pitch'] = cp_pitch
+
+    yaw, pitch, cp_static, cp_total, extrapolated = calib_data.lookup(cp_yaw, cp_pitch, flags=True)
+    found = np.isfinite(yaw) & np.isfinite(pitch) & np.isfinite(cp_static) & np.isfinite(cp_total)
+    status[~found] |= OUT_OF_CALIBRATION
+    status[extrapolated & found] |= EXTRAPOLATED
+    status[~(dynamic > 0.0)] |= NEGATIVE_DYNAMIC_PRESSURE # Also catches NaN.
+
+    Ptotal = P1 - cp_total*dynamic
+    Pstatic = Pavg - cp_static*dynamic
+    vel = Ptotal - Pstatic
+    status[~(vel >= 0.0) & found] |= NEGATIVE_DYNAMIC_PRESSURE
+
+    unusable = (status & (OUT_OF_CALIBRATION | REFERENCE_PRESSURE_FAILURE)) != 0
+    for column in (yaw, pitch, cp_static, cp_total, Ptotal, Pstatic):
+        column[unusable] = 0.0
+    vel[((status & ~np.uint8(EXTRAPOLATED)) != 0) | ~(vel >= 0.0)] = 0.0
+    np.sqrt(vel, out=vel)
+    vel *= 2.0/rho
+
+    yaw_rad = np.radians(yaw)
+    pitch_rad = np.radians(pitch)
+    horizontal = np.cos(pitch_rad)*vel
+
+    columns.update(yaw=yaw, pitch=pitch, cp_static=cp_static, cp_total=cp_total, Ptotal=Ptotal, Pstatic=Pstatic,
+                   vel=vel, Vx=np.sin(yaw_rad)*horizontal, Vy=np.cos(yaw_rad)*horizontal,
+                   Vz=np.sin(pitch_rad)*vel, status=status, valid=status == 0)
+    return columns
+
+def status_summary(status):
+    """Returns a one-line count of the invalid points in a *status* column by reason, or None if all are valid."""
+
+    return status_counts_summary(np.bincount(np.asarray(status, dtype=np.uint8), minlength=STATUS_COMBINATIONS))
+
+def status_counts_summary(counts):
+    """Returns the *status_summary* of points counted per status value, e.g. a running np.bincount of the status
+    column with STATUS_COMBINATIONS bins, or None if all are valid."""
+
+    invalid = int(counts[1:].sum())
+    if not invalid:
+        return None
+    flags = np.arange(len(counts))
+    reasons = ", ".join("{} {}".format(int(counts[(flags & flag) != 0].sum()), name)
+                        for flag, name in STATUS_NAMES.items() if counts[(flags & flag) != 0].any())
+    return "{} of {} points invalid ({})".format(invalid, int(counts.sum()), reasons)
+
+_RESULTS_SEPARATORS = str.maketrans("();", "  ,")
+
+def _parse_results_lines(lines,first_line):
+    """Parses "(x,z);(V1,V2,V3,V4,V5)" **lines** into an (N,7) array with a single vectorized parse."""
+
+    text = ",".join(line.translate(_RESULTS_SEPARATORS) for line in lines)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning) # numpy warns instead of failing on bad data.
+            values = np.fromstring(text, sep=',')
+    except (ValueError, DeprecationWarning):
+        values = None
+    if values is not None and values.size == 7*len(lines):
+        return values.reshape(-1, 7)
+
+    for line_number, line in enumerate(lines, first_line): # Slow path, only to report the bad line.
+        fields = line.translate(_RESULTS_SEPARATORS).split(',')
+        try:
+            if len(fields) != 7:
+                raise ValueError("expected 7 values, found {}".format(len(fields)))
+            [float(field) for field in fields]
+        except ValueError as error:
+            raise ValueError("Bad results line {}: {!r} ({})".format(line_number, line, error))
+    raise ValueError("Bad results lines {} to {}".format(first_line, first_line + len(lines) - 1))
+
+def read_results(results_filename,chunk_size=65536):
+    """Streams a results file of "(x,z);(V1,V2,V3,V4,V5)" lines in chunks of at most **chunk_size** points, so files
+    of any length are read with bounded memory. Blank lines are skipped.
+
+    Yields [coords,voltages] pairs of (N,2) and (N,5) arrays.
+    """
+
+    with open(results_filename) as results_file:
+        line_number = 1
+        while True:
+            lines = list(itertools.islice(results_file, chunk_size))
+            if not lines:
+                return
+            first_line = line_number
+            line_number += len(lines)
+            lines = [line.strip() for line in lines]
+            lines = [line for line in lines if line]
+            if lines:
+                values = _parse_results_lines(lines, first_line)
+                yield values[:, :2], values[:, 2:]
+
+def reduce_results(results_filename,calib_data,Pref,density,chunk_size=65536,sensors=None):
+    """Reduces a results file chunk by chunk with *reduce_voltages*. Yields one dict of columns per chunk."""
+
+    for coords, voltages in read_results(results_filename, chunk_size):
+        yield reduce_voltages(voltages, Pref, density, calib_data, coords[:, 0], coords[:, 1], sensors)
+
+def process_results_file(results_filename,calib_data,Pref,density,out_filename=None,chunk_size=65536,sensors=None):
+    """Reduces **results_filename** straight into its _Results.csv one chunk at a time, without holding the whole
+    file in memory. Returns the number of points written.
+
+    out_filename: Defaults to <results file>_Results.csv. It is written under a temporary name and only replaces
+        any existing file once the whole results file has been reduced, so a failure leaves no partial output.
+    """
+
+    if out_filename is None:
+        out_filename = os.path.splitext(results_filename)[0] + "_Results.csv"
+    tmp_filename = out_filename + ".tmp"
+    status_counts = np.zeros(STATUS_COMBINATIONS, dtype=np.int64)
+    try:
+        with open(tmp_filename, 'w') as results_out:
+            results_out.write(CSV_HEADER)
+            for columns in reduce_results(results_filename, calib_data, Pref, density, chunk_size, sensors):
+                write_csv_rows(results_out, csv_table(columns))
+                status_counts += np.bincount(columns['status'], minlength=STATUS_COMBINATIONS)
+        os.replace(tmp_filename, out_filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+    summary = status_counts_summary(status_counts)
+    if summary:
+        print("WARNING: {}: {}".format(results_filename, summary))
+    return int(status_counts.sum())
 
 class TestPoint:
+    """A single reduced test point. The reduction is done by *reduce_voltages*; a TestPoint only holds one row of
+    its columns, either for one sample given here or as a view of a row of TestData.columns (*from_columns()*)."""
 
-    def __init__(self, x, z, V1, V2, V3, V4, V5, P_ref, rho, calib_data):
+    def __init__(self, x, z, V1, V2, V3, V4, V5, P_ref, rho, calib_data, sensors=None):
         self.calib_data = calib_data
 
-        self.x = x
-        self.z = z
         self.V1 = V1
         self.V2 = V2
         self.V3 = V3
         self.V4 = V4
         self.V5 = V5
-
-        self.P1 = self.get_pressure_30psi_sensor(V1) + P_ref
-        self.P2 = self.get_pressure_30psi_sensor(V2) + P_ref
-        self.P3 = self.get_pressure_30psi_sensor(V3) + P_ref
-        self.P4 = self.get_pressure_30psi_sensor(V4) + P_ref
-        self.P5 = self.get_pressure_30psi_sensor(V5) + P_ref
-        self.Pavg = (self.P2 + self.P3 + self.P4 + self.P5) / 4.0
-        self.Pref = Pref
+        self.Pref = P_ref
         self.rho = rho
 
-        self.cp_yaw = (self.P2 - self.P3) / (self.P1 - self.Pavg)
-        self.cp_pitch = (self.P4 - self.P5) / (self.P1 - self.Pavg)
-        try:
-            angles = self.get_angles()
-            self.yaw = angles[0]
-            self.pitch = angles[1]
-            self.cp_static = self.get_cp_static()
-            self.cp_total = self.get_cp_total()
-
-            self.Ptotal = self.get_Ptotal()
-            self.Pstatic = self.get_Pstatic()
-
-            self.vel = self.get_velocity()
-
-        except:
-            print("BAD POINT")
-            self.yaw = 0.0
-            self.pitch = 0.0
-            self.cp_static = 0.0
-            self.cp_total = 0.0
-            self.vel = 0.0
-            self.Pstatic = 0.0
-            self.Ptotal = 0.0
+        columns = reduce_voltages([[V1, V2, V3, V4, V5]], P_ref, rho, calib_data, [x], [z], sensors)
+        for name, column in columns.items():
+            setattr(self, name, column[0].item())
+
+    @classmethod
+    def from_columns(cls, columns, index, calib_data=None):
+        """Returns the TestPoint of row **index** of the reduced **columns**."""
+
+        point = cls.__new__(cls)
+        point.calib_data = calib_data
+        for name, column in columns.items():
+            setattr(point, name, column[index].item())
+        return point
+
+    # The getters below are kept for old scripts. They return the values reduce_voltages found for this point.
 
     def get_pressure_30psi_sensor(self,voltage):
+        """Use a SensorArray (see SensorModels) for other sensors."""
         return voltage*(30.0/5.0)
 
     def get_angles(self):
-        yaw_lines = self.calib_data.yaw_lines
-        pitch_lines = self.calib_data.pitch_lines
-        new_lines = []
-        for yaw in yaw_lines.keys():
-            curr_cp_pitches = [yaw_lines[yaw][pitch].cp_pitch for pitch in yaw_lines[yaw].keys()]
-            curr_cp_yaws = [yaw_lines[yaw][pitch].cp_yaw for pitch in yaw_lines[yaw].keys()]
-            new_lines.append([self.cp_pitch, lin_interp(curr_cp_pitches, curr_cp_yaws, self.cp_pitch)])
-        curr_cp_yaws = [line[1] for line in new_lines]
-        yaw = lin_interp(curr_cp_yaws, list(yaw_lines.keys()), self.cp_yaw)
-
-        new_lines = []
-        for pitch in pitch_lines.keys():
-            curr_cp_pitches = [pitch_lines[pitch][yaw].cp_pitch for yaw in pitch_lines[pitch].keys()]
-            curr_cp_yaws = [pitch_lines[pitch][yaw].cp_yaw for yaw in pitch_lines[pitch].keys()]
-            new_lines.append([self.cp_yaw, lin_interp(curr_cp_yaws, curr_cp_pitches, self.cp_yaw)])
-        curr_cp_pitches = [line[1] for line in new_lines]
-        pitch = lin_interp(curr_cp_pitches, list(pitch_lines.keys()), self.cp_pitch)
-
-        return [yaw, pitch]
+        return [self.yaw, self.pitch]
 
     def get_cp_static(self):
-        yaw_lines = self.calib_data.yaw_lines
-        for ind, yaw in enumerate(list(yaw_lines.keys())):
-            if yaw < self.yaw and list(yaw_lines.keys())[ind + 1] > self.yaw:
-                pitches_low = list(yaw_lines[yaw].keys())
-                cp_statics_low = [yaw_lines[yaw][pitch].cp_static for pitch in yaw_lines[yaw].keys()]
-                lower_int = lin_interp(pitches_low, cp_statics_low, self.pitch)
-
-                pitches_high = list(yaw_lines[list(yaw_lines.keys())[ind + 1]].keys())
-                cp_statics_high = [yaw_lines[list(yaw_lines.keys())[ind + 1]][pitch].cp_static for pitch in
-                                   list(yaw_lines[list(yaw_lines.keys())[ind + 1]].keys())]
-                higher_int = lin_interp(pitches_high, cp_statics_high, self.pitch)
-
-                cp_static = (lower_int + higher_int) / 2.0
-                return cp_static
+        return self.cp_static
 
     def get_cp_total(self):
-        yaw_lines = self.calib_data.yaw_lines
-        for ind, yaw in enumerate(list(yaw_lines.keys())):
-            if yaw < self.yaw and list(yaw_lines.keys())[ind + 1] > self.yaw:
-                pitches_low = list(yaw_lines[yaw].keys())
-                cp_totals_low = [yaw_lines[yaw][pitch].cp_total for pitch in yaw_lines[yaw].keys()]
-                lower_int = lin_interp(pitches_low, cp_totals_low, self.pitch)
-
-                pitches_high = list(yaw_lines[list(yaw_lines.keys())[ind + 1]].keys())
-                cp_totals_high = [yaw_lines[list(yaw_lines.keys())[ind + 1]][pitch].cp_total for pitch in
-                                  list(yaw_lines[list(yaw_lines.keys())[ind + 1]].keys())]
-                higher_int = lin_interp(pitches_high, cp_totals_high, self.pitch)
-
-                cp_total = (lower_int + higher_int) / 2.0
-                return cp_total
+        return self.cp_total
 
     def get_Ptotal(self):
-        return self.Pref + (self.P1 - self.Pref) - self.cp_total * ((self.P1 - self.Pref) - (self.Pavg - self.Pref))
+        return self.Ptotal
 
     def get_Pstatic(self):
-        return self.Pref + (self.Pavg - self.Pref) - self.cp_static * ((self.P1 - self.Pref) - (self.Pavg - self.Pref))
+        return self.Pstatic
 
     def get_velocity(self):
-        return (2 / self.rho) * (self.Ptotal - self.Pstatic) ** 0.5
+        return self.vel
 
 class TestData:
 
-    def __init__(self,results_filename,calib_data,Pref,density):
+    def __init__(self,results_filename,calib_data,Pref,density,chunk_size=65536,sensors=None):
 
-        with open(results_filename) as results_file:
-            results_lines = results_file.readlines()
-            results_lines = [line.strip().replace('(', '').replace(')', '').split(';') for line in results_lines]
         self.results_filename = results_filename
-        self.test_points = [
-            TestPoint(float(line[0].split(',')[0]), float(line[0].split(',')[1]), float(line[1].split(',')[0]), \
-                      float(line[1].split(',')[1]), float(line[1].split(',')[2]), float(line[1].split(',')[3]), \
-                      float(line[1].split(',')[4]), Pref, density, calib_data) for line in results_lines]
-
-    def write(self):
-        out_filename = os.path.splitext(self.results_filename)[0] + "_Results.csv"
-        with open(out_filename, 'w') as results_out:
-            results_out.write("X(mm),Z(mm),Vx(mm/s),Vy(mm/s),Vz(mm/s),P(Pa),P0(Pa),T(K)\n")
-
-            X = []
-            Y = []
-            Z = []
-            u = []
-            v = []
-            w = []
-            
-            
-            for point in self.test_points:
-
-                Vx = np.sin(point.yaw * (np.pi / 180.0)) * np.cos(point.pitch * (np.pi / 180.0)) * point.vel
-                Vy = np.cos(point.yaw * (np.pi / 180.0)) * np.cos(point.pitch * (np.pi / 180.0)) * point.vel
-                Vz = np.sin(point.pitch * (np.pi / 180.0)) * point.vel
-
-                if np.iscomplex(Vx):
-                    Vx = 0.0
-                if np.iscomplex(Vy):
-                    Vy = 0.0
-                if np.iscomplex(Vz):
-                    Vz = 0.0
-
-
-                
-                X.append(point.x)
-                Y.append(0.0)
-                Z.append(point.z)
-                u.append(Vz)
-                v.append(Vy)
-                w.append(-Vx)
-
-                
-                
-                results_out.write(
-                    "{},{},{},{},{},{},{},{}\n".format(point.x, point.z, Vx * 304.8, Vy * 304.8, Vz * 304.8,
-                                                       point.Pstatic * 6894.76, point.Ptotal * 6894.76, 293.0))
-
-            fig = plt.figure()
-            ax = fig.gca(projection='3d')
-            ax.quiver(X,Y,Z,u,v,w,arrow_length_ratio=0.1)
-            ax.set_xlim3d(0,300)
-            ax.set_zlim3d(0,300)
-            ax.set_xlabel("x")
-            ax.set_ylabel("y")
-            ax.set_zlabel("z")
-            ax.set_ylim3d(0,1000)
-            plt.show()
+        self.calib_data = calib_data
+
+        chunks = list(reduce_results(results_filename, calib_data, Pref, density, chunk_size, sensors))
+        if not chunks:
+            chunks = [reduce_voltages(np.empty((0, 5)), Pref, density, calib_data, np.empty(0), np.empty(0), sensors)]
+        self.columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+        summary = status_summary(self.columns['status'])
+        if summary:
+            print("WARNING: {}: {}".format(results_filename, summary))
+
+    @property
+    def test_points(self):
+        """TestPoint views of every reduced point. Prefer *columns* for anything but small files."""
+
+        return [TestPoint.from_columns(self.columns, ind, self.calib_data) for ind in range(len(self.columns['x']))]
+
+    def write(self,out_filename=None,plot=None):
+        """Writes the reduced points. Nothing is shown on screen.
+
+        out_filename: Output file, its extension picks the format (.csv, .npz, .h5, .parquet, see ResultsWriters).
+            Defaults to <results file>_Results.csv.
+        plot: If given, a file (e.g. .png) to save a 3-D quiver plot of the velocities to.
+        """
+
+        if out_filename is None:
+            out_filename = os.path.splitext(self.results_filename)[0] + "_Results.csv"
+        write_results(self.columns, out_filename)
+        if plot:
+            plot_results(self.columns, plot)
 
 
 if __name__ =="__main__":
@@ -245,7 +577,7 @@ if __name__ =="__main__":
     Pref = 14.5  # psia
     density = 0.002297145 # slugs/ft^3
     sample_test = TestData(results_filename,sample_calibration,Pref,density)
-    sample_test.write()
+    sample_test.write(plot=os.path.splitext(results_filename)[0] + "_Quiver.png")
 
 
 
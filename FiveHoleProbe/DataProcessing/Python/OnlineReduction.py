@@ -0,0 +1,230 @@
+"""Reduces five hole probe samples while the traverse is still running.
+
+Samples acquired at each traverse point are pushed into a bounded ring buffer, and a background thread reduces them
+against a preloaded CalibData in batches as they arrive. It appends each batch to the _Results.csv and, optionally,
+the raw samples to a "(x,z);(V1,V2,V3,V4,V5)" results file that TestData can reprocess later. Results are available
+live through a callback and running statistics, and an abort check can end a bad run early.
+
+    with OnlineReduction(calib_data, Pref, density, "Run1_Results.csv", raw_filename="Run1.csv",
+                         abort=max_invalid_fraction(0.2)) as reduction:
+        run_points(printer, points, progress=reduction.acquire_with(read_voltages), stop=reduction.stopped)
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from FiveHoleProbe_CalibrationAndProcessing import STATUS_COMBINATIONS, reduce_voltages, status_counts_summary
+from ResultsWriters import CSV_HEADER, csv_table, write_csv_rows
+
+RAW_FORMAT = "(%.10g,%.10g);(%.10g,%.10g,%.10g,%.10g,%.10g)\n"
+
+class RingBuffer:
+    """Bounded FIFO of (x, z, V1..V5) sample rows in a preallocated array, shared by one producer and one consumer
+    thread. *push()* blocks while the buffer is full, so acquisition is slowed rather than samples lost.
+
+        capacity: Number of rows held.
+    """
+
+    def __init__(self, capacity=65536):
+        self.rows = np.empty((capacity, 7))
+        self.head = 0 # Next row to read.
+        self.count = 0
+        self.closed = False
+        self.changed = threading.Condition()
+
+    def push(self, rows, timeout=None):
+        """Appends the (N,7) **rows**. Raises TimeoutError if they could not all be queued within **timeout**."""
+
+        rows = np.asarray(rows, dtype=float).reshape(-1, 7)
+        capacity = len(self.rows)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.changed:
+            while len(rows):
+                while self.count == capacity and not self.closed:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("Reduction fell behind; ring buffer full.")
+                    self.changed.wait(remaining)
+                if self.closed:
+                    raise ValueError("Ring buffer is closed.")
+
+                tail = (self.head + self.count) % capacity
+                size = min(len(rows), capacity - self.count, capacity - tail)
+                self.rows[tail:tail + size] = rows[:size]
+                self.count += size
+                rows = rows[size:]
+                self.changed.notify_all()
+
+    def pop(self, limit, timeout=None):
+        """Removes and returns up to **limit** rows, waiting up to **timeout** for any. Returns an empty array on
+        timeout, or None once the buffer is closed and empty."""
+
+        with self.changed:
+            if not self.count and not self.closed:
+                self.changed.wait(timeout)
+            if not self.count:
+                return None if self.closed else np.empty((0, 7))
+            size = min(limit, self.count, len(self.rows) - self.head)
+            rows = self.rows[self.head:self.head + size].copy()
+            self.head = (self.head + size) % len(self.rows)
+            self.count -= size
+            self.changed.notify_all()
+            return rows
+
+    def close(self):
+        """Stops further pushes. Rows already queued can still be popped."""
+
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+class OnlineReduction:
+    """Background reduction of samples as they are acquired.
+
+        calib_data: Preloaded CalibData.
+        Pref: Reference pressure (psia).
+        density: Density of the flow.
+        out_filename: _Results.csv to append reduced points to, as TestData.write() writes it. None keeps results
+            in memory only (*status_counts*, *latest*).
+        raw_filename: Optional results file to append the raw samples to, in the format TestData reads.
+        capacity: Rows held by the ring buffer.
+        batch_size: Most rows reduced at once.
+        sensors: SensorArray (see SensorModels). Defaults to 30 psi, 5 V transducers.
+        on_result: Called from the worker thread with the reduced columns of every batch, e.g. to update a live
+            display. Should be quick.
+        abort: Called from the worker thread after every batch with (columns, reduction). Returning a message
+            stops the run: *stopped()* becomes True and the message is kept in *aborted*.
+    """
+
+    def __init__(self, calib_data, Pref, density, out_filename=None, raw_filename=None, capacity=65536,
+                 batch_size=4096, sensors=None, on_result=None, abort=None):
+
+        self.calib_data = calib_data
+        self.Pref = Pref
+        self.density = density
+        self.out_filename = out_filename
+        self.raw_filename = raw_filename
+        self.batch_size = batch_size
+        self.sensors = sensors
+        self.on_result = on_result
+        self.abort = abort
+
+        self.buffer = RingBuffer(capacity)
+        self.status_counts = np.zeros(STATUS_COMBINATIONS, dtype=np.int64)
+        self.latest = None # Reduced columns of the last batch.
+        self.aborted = None
+        self.error = None
+        self._thread = None
+
+    @property
+    def reduced(self):
+        """Number of samples reduced so far."""
+
+        return int(self.status_counts.sum())
+
+    def start(self):
+        """Starts the worker thread."""
+
+        self._thread = threading.Thread(target=self._run, name="OnlineReduction", daemon=True)
+        self._thread.start()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            # Only stop the worker, so an error of the worker does not hide the one already raised.
+            self.buffer.close()
+            if self._thread is not None:
+                self._thread.join()
+
+    def stopped(self):
+        """True once the run should stop: aborted by the abort check, or the worker failed."""
+
+        return self.aborted is not None or self.error is not None
+
+    def push(self, x, z, voltages, timeout=None):
+        """Queues samples taken at traverse position **x**, **z**. **voltages** is 5 values or (N,5) samples."""
+
+        if self.error is not None:
+            raise RuntimeError("Online reduction failed.") from self.error
+        voltages = np.asarray(voltages, dtype=float).reshape(-1, 5)
+        coords = np.broadcast_to([float(x), float(z)], (len(voltages), 2))
+        self.buffer.push(np.column_stack([coords, voltages]), timeout)
+
+    def acquire_with(self, acquire):
+        """Returns a run_points() progress function that calls **acquire(point)** for the voltages at each [x,y,z]
+        point and queues them at that point's x and z."""
+
+        def progress(point):
+            self.push(point[0], point[2], acquire(point))
+        return progress
+
+    def _run(self):
+        out_file = raw_file = None
+        try:
+            if self.out_filename is not None:
+                out_file = open(self.out_filename, 'w')
+                out_file.write(CSV_HEADER)
+            if self.raw_filename is not None:
+                raw_file = open(self.raw_filename, 'w')
+
+            while True:
+                rows = self.buffer.pop(self.batch_size, timeout=0.5)
+                if rows is None:
+                    break
+                if not len(rows):
+                    continue
+
+                columns = reduce_voltages(rows[:, 2:], self.Pref, self.density, self.calib_data, rows[:, 0],
+                                          rows[:, 1], self.sensors)
+                if raw_file is not None:
+                    raw_file.write((RAW_FORMAT*len(rows)) % tuple(rows.ravel().tolist()))
+                    raw_file.flush()
+                if out_file is not None:
+                    write_csv_rows(out_file, csv_table(columns))
+                    out_file.flush()
+                self.status_counts += np.bincount(columns['status'], minlength=STATUS_COMBINATIONS)
+                self.latest = columns
+
+                if self.on_result is not None:
+                    self.on_result(columns)
+                if self.abort is not None and self.aborted is None:
+                    self.aborted = self.abort(columns, self) or None
+                    if self.aborted is not None:
+                        print("ABORTING RUN: {}".format(self.aborted))
+        except Exception as error:
+            self.error = error
+            self.buffer.close()
+        finally:
+            for open_file in (out_file, raw_file):
+                if open_file is not None:
+                    open_file.close()
+
+    def close(self, timeout=None):
+        """Reduces everything still queued, stops the worker and closes the files. Returns a one-line summary of the
+        invalid points, or None if all were valid. Raises the worker's error if it failed."""
+
+        self.buffer.close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.error is not None:
+            raise RuntimeError("Online reduction failed.") from self.error
+        return status_counts_summary(self.status_counts)
+
+def max_invalid_fraction(fraction, minimum=100):
+    """Returns an abort check that stops the run once more than **fraction** of the samples reduced so far are
+    invalid, after at least **minimum** samples."""
+
+    def check(columns, reduction):
+        total = reduction.reduced
+        invalid = total - int(reduction.status_counts[0])
+        if total >= minimum and invalid > fraction*total:
+            return "{} of {} samples invalid".format(invalid, total)
+        return None
+    return check
@@ -0,0 +1,198 @@
+"""Benchmarks the five hole probe reduction against synthetic data from an analytic probe model.
+
+For every combination of calibration grid size and point count, a condensed calibration csv and a results file of
+voltages are generated from *probe_model()*, then each stage of the pipeline is timed on them: calibration build,
+parse, inversion, reduction (velocities) and write. Peak traced memory of each stage and the errors of the recovered
+angles and velocities against the model are recorded alongside, and the report is written as JSON so performance and
+accuracy regressions show up together. Peak memory is measured in a second, traced pass so the timings are not
+slowed by tracemalloc.
+
+    python ProcessingBenchmark.py --grids 10 41 161 --points 1000 100000 --output bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from FiveHoleProbe_CalibrationAndProcessing import CalibData, read_results, reduce_voltages
+from ResultsWriters import write_results
+
+P_REF = 14.5 # psia
+DENSITY = 0.002297145 # slugs/ft^3
+ANGLE_RANGE = 30.0 # Calibration spans -ANGLE_RANGE to ANGLE_RANGE degrees in yaw and pitch.
+BLOCK = 65536 # Lines formatted per string operation when generating results files.
+
+def probe_model(yaw, pitch):
+    """Analytic probe: returns (cp_yaw, cp_pitch, cp_static, cp_total) at **yaw**, **pitch** in degrees."""
+
+    yaw = np.radians(yaw)
+    pitch = np.radians(pitch)
+    cone = yaw**2 + pitch**2
+    return (2.2*np.sin(yaw) + 0.1*np.sin(yaw)*np.cos(pitch), 2.0*np.sin(pitch) + 0.05*np.sin(pitch)*np.cos(yaw),
+            0.3 + 0.4*cone, 0.02 + 0.3*cone)
+
+def write_calibration(filename, size):
+    """Writes a condensed calibration csv of the model on a **size** by **size** (yaw, pitch) grid."""
+
+    angles = np.linspace(-ANGLE_RANGE, ANGLE_RANGE, size)
+    yaw, pitch = [grid.ravel() for grid in np.meshgrid(angles, angles, indexing='ij')]
+    np.savetxt(filename, np.column_stack([pitch, yaw, *probe_model(yaw, pitch)]), fmt='%.12g', delimiter=',',
+               header="pitch,yaw,cp_yaw,cp_pitch,cp_static,cp_total", comments="")
+
+def write_voltages(filename, count, seed=0):
+    """Writes a results file of **count** "(x,z);(V1,V2,V3,V4,V5)" lines sampled inside the calibration.
+
+    Returns the true (yaw, pitch, vel) of every line.
+    """
+
+    rng = np.random.default_rng(seed)
+    limit = 0.8*ANGLE_RANGE
+    yaw = rng.uniform(-limit, limit, count)
+    pitch = rng.uniform(-limit, limit, count)
+    cp_yaw, cp_pitch, cp_static, cp_total = probe_model(yaw, pitch)
+
+    dynamic = rng.uniform(0.3, 0.7, count)
+    Pavg = P_REF + 0.2
+    pressures = np.column_stack([Pavg + dynamic, Pavg + cp_yaw*dynamic/2, Pavg - cp_yaw*dynamic/2,
+                                 Pavg + cp_pitch*dynamic/2, Pavg - cp_pitch*dynamic/2])
+    voltages = (pressures - P_REF)*(5.0/30.0)
+    coords = np.column_stack([np.arange(count) % 300, np.arange(count)//300 % 300])
+
+    line_format = "(%d,%d);(%.12g,%.12g,%.12g,%.12g,%.12g)\n"
+    with open(filename, 'w') as out_file:
+        for start in range(0, count, BLOCK):
+            rows = np.column_stack([coords[start:start + BLOCK], voltages[start:start + BLOCK]])
+            out_file.write((line_format*len(rows)) % tuple(rows.ravel().tolist()))
+
+    vel = (2.0/DENSITY)*np.sqrt(dynamic*(1.0 - cp_total + cp_static))
+    return yaw, pitch, vel
+
+@contextlib.contextmanager
+def measure(stage, report):
+    """Records the enclosed block in **report**: its peak memory as report[stage + "_mb"] while tracemalloc is
+    tracing, its duration as report[stage + "_s"] otherwise."""
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    yield
+    if tracing:
+        report[stage + "_mb"] = (tracemalloc.get_traced_memory()[1] - base)/1e6
+    else:
+        report[stage + "_s"] = time.perf_counter() - start
+
+def run_stages(calib_filename, results_filename, out_filename, report):
+    """Runs each stage of the pipeline once under *measure()*. Returns the reduced columns."""
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with measure("calibration", report):
+            calib_data = CalibData(calib_filename)
+        with measure("parse", report):
+            chunks = list(read_results(results_filename))
+            coords = np.concatenate([chunk[0] for chunk in chunks])
+            voltages = np.concatenate([chunk[1] for chunk in chunks])
+            del chunks
+        with measure("reduce", report):
+            columns = reduce_voltages(voltages, P_REF, DENSITY, calib_data, coords[:, 0], coords[:, 1])
+        with measure("inversion", report):
+            calib_data.lookup(columns['cp_yaw'], columns['cp_pitch'])
+        with measure("write", report):
+            write_results(columns, out_filename)
+    return columns
+
+def run_benchmark(grid, count, directory, seed=0, memory=True):
+    """Runs every stage for one calibration **grid** size and point **count**. Returns its measurements as a dict."""
+
+    calib_filename = os.path.join(directory, "calib_{}.csv".format(grid))
+    results_filename = os.path.join(directory, "points_{}_{}.csv".format(count, seed))
+    if not os.path.exists(calib_filename):
+        write_calibration(calib_filename, grid)
+    truth_filename = results_filename + ".truth.npy"
+    if os.path.exists(truth_filename):
+        yaw, pitch, vel = np.load(truth_filename)
+    else:
+        yaw, pitch, vel = write_voltages(results_filename, count, seed)
+        np.save(truth_filename, np.array([yaw, pitch, vel]))
+
+    report = {"grid": grid, "points": count}
+    out_filename = os.path.join(directory, "points_{}_{}_Results.csv".format(count, seed))
+    columns = run_stages(calib_filename, results_filename, out_filename, report)
+    if memory:
+        tracemalloc.start()
+        try:
+            run_stages(calib_filename, results_filename, out_filename, report)
+        finally:
+            tracemalloc.stop()
+
+    valid = columns['valid']
+    yaw_error = np.abs(columns['yaw'][valid] - yaw[valid])
+    pitch_error = np.abs(columns['pitch'][valid] - pitch[valid])
+    vel_error = np.abs(columns['vel'][valid] - vel[valid])/vel[valid]
+    report.update({
+        "points_per_s": count/(report["parse_s"] + report["reduce_s"] + report["write_s"]),
+        "valid_fraction": float(valid.mean()),
+        "yaw_max_error_deg": float(yaw_error.max(initial=0.0)),
+        "yaw_rms_error_deg": float(np.sqrt(np.mean(yaw_error**2))) if valid.any() else None,
+        "pitch_max_error_deg": float(pitch_error.max(initial=0.0)),
+        "pitch_rms_error_deg": float(np.sqrt(np.mean(pitch_error**2))) if valid.any() else None,
+        "vel_max_relative_error": float(vel_error.max(initial=0.0)),
+    })
+    return report
+
+def run_suite(grids=(10, 41, 161), counts=(1000, 100000), seed=0, memory=True, directory=None, verbose=True):
+    """Runs every combination of calibration **grids** and point **counts**. Returns the JSON-ready report.
+
+    directory: Where the synthetic files are written and kept. A temporary directory is used if None.
+    """
+
+    with contextlib.ExitStack() as stack:
+        if directory is None:
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+
+        results = []
+        for grid in grids:
+            for count in counts:
+                result = run_benchmark(grid, count, directory, seed, memory)
+                results.append(result)
+                if verbose:
+                    print("{grid:>4}x{grid:<4} {points:>9} points: calibration {calibration_s:7.3f} s, "
+                          "parse {parse_s:7.3f} s, reduce {reduce_s:7.3f} s, write {write_s:7.3f} s, "
+                          "yaw error {yaw_max_error_deg:.4f} deg".format(**result))
+    return {
+        "benchmark": "processing",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "seed": seed,
+        "memory_traced": memory,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the five hole probe reduction on synthetic data.")
+    parser.add_argument("--grids", type=int, nargs="+", default=[10, 41, 161], help="Calibration grid sizes.")
+    parser.add_argument("--points", type=int, nargs="+", default=[1000, 100000], help="Points per results file.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced pass that measures peak memory.")
+    parser.add_argument("--directory", help="Keep the synthetic files in this directory.")
+    parser.add_argument("--output", help="JSON file to write. Printed to stdout if not given.")
+    args = parser.parse_args()
+
+    if args.directory:
+        os.makedirs(args.directory, exist_ok=True)
+    report = run_suite(args.grids, args.points, args.seed, not args.no_memory, args.directory,
+                       verbose=args.output is not None)
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
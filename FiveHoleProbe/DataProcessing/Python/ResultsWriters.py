@@ -0,0 +1,107 @@
+"""Output stage of the five hole probe reduction.
+
+Writers take the columnar reduced arrays (the dict returned by reduce_voltages / TestData.columns) and write them in
+bulk. The format is picked from the file extension:
+
+    .csv        The _Results.csv table (X, Z, Vx, Vy, Vz, P, P0, T), formatted a block of rows at a time.
+    .npz        Every reduced column, uncompressed.
+    .h5/.hdf5   Every reduced column as a dataset. Needs h5py.
+    .parquet    Every reduced column. Needs pyarrow.
+
+Plotting is a separate, opt-in step that renders off-screen and saves to a file, so it never needs a display.
+"""
+
+import os
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+CSV_HEADER = "X(mm),Z(mm),Vx(mm/s),Vy(mm/s),Vz(mm/s),P(Pa),P0(Pa),T(K)\n"
+CSV_BLOCK = 65536 # Rows formatted per string operation.
+
+def csv_table(columns):
+    """Returns the (N,8) table written to the _Results.csv files: X(mm),Z(mm),Vx,Vy,Vz(mm/s),P,P0(Pa),T(K)."""
+
+    return np.column_stack([columns['x'], columns['z'], columns['Vx']*304.8, columns['Vy']*304.8,
+                            columns['Vz']*304.8, columns['Pstatic']*6894.76, columns['Ptotal']*6894.76,
+                            np.full(len(columns['x']), 293.0)])
+
+def write_csv_rows(out_file, table, fmt='%.10g'):
+    """Writes the rows of the 2-D **table** to the open **out_file**, formatting a whole block of rows with one
+    string operation instead of one per row."""
+
+    row_format = ",".join([fmt]*table.shape[1]) + "\n"
+    for start in range(0, len(table), CSV_BLOCK):
+        block = table[start:start + CSV_BLOCK]
+        out_file.write((row_format*len(block)) % tuple(block.ravel().tolist()))
+
+def write_csv(columns, filename):
+    with open(filename, 'w') as out_file:
+        out_file.write(CSV_HEADER)
+        write_csv_rows(out_file, csv_table(columns))
+
+def write_npz(columns, filename):
+    np.savez(filename, **columns)
+
+def write_hdf5(columns, filename):
+    if h5py is None:
+        raise ImportError("Writing HDF5 needs h5py.")
+    with h5py.File(filename, 'w') as out_file:
+        for name, column in columns.items():
+            out_file.create_dataset(name, data=column)
+
+def write_parquet(columns, filename):
+    if pyarrow is None:
+        raise ImportError("Writing Parquet needs pyarrow.")
+    pyarrow.parquet.write_table(pyarrow.table({name: np.asarray(column) for name, column in columns.items()}),
+                                filename)
+
+WRITERS = {
+    ".csv": write_csv,
+    ".npz": write_npz,
+    ".h5": write_hdf5,
+    ".hdf5": write_hdf5,
+    ".parquet": write_parquet,
+}
+
+def write_results(columns, filename):
+    """Writes the reduced **columns** to **filename** in the format given by its extension (see WRITERS)."""
+
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError("Unknown results format {!r}. Use one of: {}".format(extension, ", ".join(WRITERS)))
+    WRITERS[extension](columns, filename)
+
+def plot_results(columns, filename, xlim=(0, 300), ylim=(0, 1000), zlim=(0, 300), dpi=150):
+    """Saves a 3-D quiver plot of the velocity vectors to **filename** (any format matplotlib can save).
+
+    Renders with the Agg canvas directly, without pyplot, so it works without a display and never blocks.
+    """
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    import mpl_toolkits.mplot3d # Registers the 3d projection on older matplotlib.
+
+    X = columns['x']
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(projection='3d')
+    ax.quiver(X, np.zeros(len(X)), columns['z'], columns['Vz'], columns['Vy'], -columns['Vx'],
+              arrow_length_ratio=0.1)
+    ax.set_xlim3d(*xlim)
+    ax.set_ylim3d(*ylim)
+    ax.set_zlim3d(*zlim)
+    ax.set_xlabel("x")
+    ax.set_ylabel("y")
+    ax.set_zlabel("z")
+    fig.savefig(filename, dpi=dpi)
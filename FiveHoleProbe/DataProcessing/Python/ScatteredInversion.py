@@ -0,0 +1,89 @@
+"""Calibration inversion for scattered calibration points.
+
+The grid inversion of CalibData needs the calibration on a (yaw, pitch) grid. ScatteredInversion instead triangulates
+the calibration points once in (cp_yaw, cp_pitch) space, so calibrations with missing or rejected points and
+non-uniform steps invert correctly. Each query is located in its triangle and interpolated linearly with barycentric
+weights. Queries outside the triangulation are optionally extrapolated from their nearest calibration points by
+inverse distance weighting, and flagged either way.
+"""
+
+import numpy as np
+
+try:
+    from scipy.spatial import Delaunay, cKDTree
+except ImportError:
+    Delaunay = cKDTree = None
+
+class ScatteredInversion:
+    """Inverts scattered calibration points from (cp_yaw, cp_pitch) to (yaw, pitch, cp_static, cp_total).
+
+        points: (N,6) calibration points with columns yaw, pitch, cp_yaw, cp_pitch, cp_static, cp_total (as
+            CalibData.points). Rows with NaNs are dropped and points repeated in (cp_yaw, cp_pitch) are averaged.
+        extrapolate: If True, queries outside the triangulation are extrapolated from their nearest points instead
+            of giving NaN.
+        neighbours: Number of nearest points used for extrapolation.
+        max_edge: If given, triangles with an edge longer than this (in standard deviations of cp_yaw and cp_pitch)
+            are treated as outside, so gaps and concave edges of the calibration are not bridged.
+    """
+
+    def __init__(self, points, extrapolate=False, neighbours=4, max_edge=None):
+
+        if Delaunay is None:
+            raise ImportError("Scattered calibration inversion needs scipy.")
+
+        points = np.asarray(points, dtype=float).reshape(-1, 6)
+        points = points[np.isfinite(points).all(axis=1)]
+        cps, inverse = np.unique(points[:, 2:4], axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        counts = np.bincount(inverse)
+        self.values = np.column_stack([np.bincount(inverse, points[:, col])/counts for col in (0, 1, 4, 5)])
+
+        self.scale = cps.std(axis=0)
+        self.scale[~(self.scale > 0)] = 1.0
+        self.cps = cps/self.scale
+        self.extrapolate = extrapolate
+        self.neighbours = min(neighbours, len(self.cps))
+
+        self.triangulation = Delaunay(self.cps)
+        self.usable = np.ones(len(self.triangulation.simplices), dtype=bool)
+        if max_edge is not None:
+            corners = self.cps[self.triangulation.simplices]
+            edges = np.linalg.norm(corners - np.roll(corners, 1, axis=1), axis=2)
+            self.usable = edges.max(axis=1) <= max_edge
+        self.tree = cKDTree(self.cps)
+
+    def lookup(self, cp_yaw, cp_pitch):
+        """Returns arrays (yaw, pitch, cp_static, cp_total, outside) for measured **cp_yaw**, **cp_pitch**.
+
+        outside is True for queries outside the triangulation, which are extrapolated if *extrapolate* and NaN
+        otherwise. Non-finite queries give NaN.
+        """
+
+        queries = np.column_stack([np.atleast_1d(np.asarray(cp_yaw, dtype=float)).ravel(),
+                                   np.atleast_1d(np.asarray(cp_pitch, dtype=float)).ravel()])/self.scale
+        values = np.full((4, len(queries)), np.nan)
+        finite = np.isfinite(queries).all(axis=1)
+
+        simplex = np.full(len(queries), -1)
+        simplex[finite] = self.triangulation.find_simplex(queries[finite])
+        inside = simplex >= 0
+        inside[inside] = self.usable[simplex[inside]]
+
+        if inside.any():
+            found = simplex[inside]
+            transform = self.triangulation.transform[found]
+            weights = np.einsum('ijk,ik->ij', transform[:, :2], queries[inside] - transform[:, 2])
+            weights = np.column_stack([weights, 1.0 - weights.sum(axis=1)])
+            corners = self.values[self.triangulation.simplices[found]]
+            values[:, inside] = np.einsum('ij,ijk->ki', weights, corners)
+
+        outside = finite & ~inside
+        if self.extrapolate and outside.any():
+            distances, ids = self.tree.query(queries[outside], k=self.neighbours)
+            distances = distances.reshape(len(ids), -1)
+            ids = ids.reshape(len(ids), -1)
+            weights = 1.0/np.maximum(distances, 1e-12)**2
+            weights /= weights.sum(axis=1, keepdims=True)
+            values[:, outside] = np.einsum('ij,ijk->ki', weights, self.values[ids])
+
+        return values[0], values[1], values[2], values[3], outside
@@ -0,0 +1,118 @@
+"""Pressure transducer models converting voltage arrays to pressures.
+
+Every sensor model is called with an array of voltages and returns the pressures (psi, relative to the reference
+pressure) as one array operation. A SensorArray holds one model per probe port and converts a whole (N,5) voltage
+array at once, optionally removing a per-run zero offset taken from tare samples. Pass it to reduce_voltages,
+TestData or process_results_file as **sensors**.
+
+    sensors = SensorArray([LinearSensor.from_range(30.0)]*3 + [LinearSensor.from_range(15.0, offset=0.02)]*2)
+    sensors.tare(voltages_with_no_flow)
+"""
+
+import numpy as np
+
+class LinearSensor:
+    """Sensor with pressure = gain*voltage + offset.
+
+        gain: psi per volt. The default is the 30 psi, 5 V transducer.
+        offset: psi at zero volts.
+    """
+
+    def __init__(self, gain=30.0/5.0, offset=0.0):
+        self.gain = float(gain)
+        self.offset = float(offset)
+
+    @classmethod
+    def from_range(cls, pressure_range, voltage_range=5.0, offset=0.0):
+        """Returns the sensor reading **pressure_range** psi at **voltage_range** volts."""
+
+        return cls(pressure_range/float(voltage_range), offset)
+
+    def __call__(self, voltages):
+        return np.asarray(voltages, dtype=float)*self.gain + self.offset
+
+class PolynomialSensor:
+    """Sensor with pressure = polynomial of the voltage.
+
+        coefficients: Polynomial coefficients, highest power first (as np.polyval).
+    """
+
+    def __init__(self, coefficients):
+        self.coefficients = np.asarray(coefficients, dtype=float)
+
+    def __call__(self, voltages):
+        return np.polyval(self.coefficients, np.asarray(voltages, dtype=float))
+
+class LookupTableSensor:
+    """Sensor interpolated linearly from a table of calibrated (voltage, pressure) pairs.
+
+        voltages, pressures: Calibration table. Sorted by voltage if not already.
+        extrapolate: If True, voltages outside the table follow its end segments; otherwise they give NaN.
+    """
+
+    def __init__(self, voltages, pressures, extrapolate=False):
+        order = np.argsort(voltages)
+        self.voltages = np.asarray(voltages, dtype=float)[order]
+        self.pressures = np.asarray(pressures, dtype=float)[order]
+        self.extrapolate = extrapolate
+        if len(self.voltages) < 2:
+            raise ValueError("A lookup table sensor needs at least two points.")
+
+    def __call__(self, voltages):
+        voltages = np.asarray(voltages, dtype=float)
+        if not self.extrapolate:
+            return np.interp(voltages, self.voltages, self.pressures, left=np.nan, right=np.nan)
+        pressures = np.interp(voltages, self.voltages, self.pressures)
+        low = voltages < self.voltages[0]
+        high = voltages > self.voltages[-1]
+        slopes = np.diff(self.pressures)/np.diff(self.voltages)
+        pressures[low] = self.pressures[0] + (voltages[low] - self.voltages[0])*slopes[0]
+        pressures[high] = self.pressures[-1] + (voltages[high] - self.voltages[-1])*slopes[-1]
+        return pressures
+
+class SensorArray:
+    """One sensor model per channel, converting (N,channels) voltage arrays in one go.
+
+    If every channel is a LinearSensor, conversion is a single multiply-add across all channels; otherwise each
+    channel's model is applied to its whole column.
+
+        sensors: Sensor model per channel, or a single model used for every channel.
+        channels: Number of channels when a single model is given.
+        zero: Per-channel zero offsets (psi) subtracted from the converted pressures. See *tare()*.
+    """
+
+    def __init__(self, sensors=None, channels=5, zero=None):
+        if sensors is None:
+            sensors = LinearSensor()
+        if callable(sensors):
+            sensors = [sensors]*channels
+        self.sensors = list(sensors)
+        self.zero = np.zeros(len(self.sensors)) if zero is None else np.asarray(zero, dtype=float)
+
+        if all(isinstance(sensor, LinearSensor) for sensor in self.sensors):
+            self.gains = np.array([sensor.gain for sensor in self.sensors])
+            self.offsets = np.array([sensor.offset for sensor in self.sensors])
+        else:
+            self.gains = self.offsets = None
+
+    def convert(self, voltages, tared=True):
+        """Returns the (N,channels) pressures of (N,channels) **voltages**, minus the zero offsets if **tared**."""
+
+        voltages = np.asarray(voltages, dtype=float).reshape(-1, len(self.sensors))
+        if self.gains is not None:
+            pressures = voltages*self.gains
+            pressures += self.offsets
+        else:
+            pressures = np.column_stack([sensor(voltages[:, ind]) for ind, sensor in enumerate(self.sensors)])
+        if tared:
+            pressures -= self.zero
+        return pressures
+
+    __call__ = convert
+
+    def tare(self, voltages):
+        """Sets the zero offsets from tare **voltages**, (N,channels) samples taken with every port at the
+        reference pressure (no flow). Returns the offsets."""
+
+        self.zero = np.nanmean(self.convert(voltages, tared=False), axis=0)
+        return self.zero
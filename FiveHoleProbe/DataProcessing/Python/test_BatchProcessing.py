@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from BatchProcessing import find_results_files, process_files
+from ProcessingBenchmark import write_calibration, write_voltages
+
+class BatchProcessingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.calib_filename = os.path.join(self.directory, "Condensed_FCalibData.csv")
+        write_calibration(self.calib_filename, 13)
+        self.results = [os.path.join(self.directory, "Run{}.csv".format(run)) for run in range(2)]
+        for run, filename in enumerate(self.results):
+            write_voltages(filename, 50, seed=run)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_calibration_in_results_directory_is_skipped(self):
+        self.assertEqual(find_results_files(self.directory, [self.calib_filename]), self.results)
+
+        results = process_files(self.directory, self.calib_filename, 14.5, 0.002297145, max_workers=1,
+                                verbose=False)
+        self.assertEqual(sorted(result[0] for result in results), self.results)
+        self.assertTrue(all(result[3] is None for result in results))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "Condensed_FCalibData_Results.csv")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,8 @@
 
+// Set to 1 to echo the received targets and step counts. Leave at 0 when driving the rig from RotateRig.py,
+// which only needs the "ok" sent after each move.
+#define DEBUG 0
+
 float currStepYaw = 0.0;
 float currStepPitch = 0.0;
 float desiredStepYaw = 0.0;
@@ -20,10 +24,11 @@ void setup() {
   pinMode(dirPinYaw,OUTPUT);
   pinMode(stepPinPitch,OUTPUT); 
   pinMode(dirPinPitch,OUTPUT);
+  Serial.println("start");
 }
 
 void loop() {
-  char buffer[] = {' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',}; // Receive up to 7 bytes
+  char buffer[] = {' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ',' ','\0'}; // Receive up to 20 bytes
   if (Serial.available() > 0) {
     // read the incoming byte:
     Serial.readBytesUntil('\n',buffer,20);
@@ -40,26 +45,32 @@ void loop() {
     //desiredAngle = incomingValue;
     
     // say what you got:
-
+#if DEBUG
     Serial.print("currStepPitch: ");
     Serial.println(currStepPitch);
     Serial.print("desiredStepPitch: ");
     Serial.println(desiredStepPitch);
+#endif
     
     moveToAngle(currStepYaw, desiredStepYaw, currStepPitch, desiredStepPitch);
     currStepYaw = desiredStepYaw;
     currStepPitch = desiredStepPitch;
+    Serial.println("ok"); // Move finished and settled.
   }
 }
 
 void moveToAngle(float currStepYaw, float desiredStepYaw, float currStepPitch, float desiredStepPitch){
   int delStepsYaw = desiredStepYaw - currStepYaw;
   int delStepsPitch = desiredStepPitch - currStepPitch;
+#if DEBUG
   Serial.println("INSIDE OF FUNCTION");
+#endif
   if(delStepsYaw < 0){
     digitalWrite(dirPinYaw,LOW);
     delStepsYaw = delStepsYaw * -1;
+#if DEBUG
     Serial.println("Reversing Direction.");
+#endif
   }
   else{
     digitalWrite(dirPinYaw,HIGH);
@@ -68,17 +79,21 @@ void moveToAngle(float currStepYaw, float desiredStepYaw, float currStepPitch, f
   if(delStepsPitch < 0){
     digitalWrite(dirPinPitch,LOW);
     delStepsPitch = delStepsPitch * -1;
+#if DEBUG
     Serial.println("Reversing Direction.");
+#endif
   }
   else{
     digitalWrite(dirPinPitch,HIGH);
   }
   
+#if DEBUG
   Serial.print("delStepsYaw: ");
   Serial.println(delStepsYaw);
   Serial.print("delStepsPitch: ");
   Serial.println(delStepsPitch);
   Serial.println();
+#endif
 
   if(delStepsYaw > 10){
     yawDelay = 0;
@@ -0,0 +1,101 @@
+"""Automated yaw x pitch calibration sweep of the five hole probe on the rotation rig.
+
+The rig is moved through every (yaw, pitch) point, the probe is sampled at each one, and the calibration
+coefficients are written straight to a condensed calibration csv (pitch,yaw,cp_yaw,cp_pitch,cp_static,cp_total)
+as read by CalibData. Each row is flushed as soon as it is measured, so an interrupted sweep keeps its data.
+
+    rig = RotateRig("Arduino", yawStepsPerDegree=8.0, pitchStepsPerDegree=8.0)
+    run_sweep(rig, np.arange(-30, 31, 2), np.arange(-30, 31, 2), acquire, "Condensed_FCalibData.csv")
+
+Sweeps planned with several passes (see SweepPlanner) add a seventh "pass" column, which CalibData ignores.
+"""
+
+import numpy as np
+
+from SweepPlanner import plan_sweep
+
+CALIBRATION_HEADER = "pitch,yaw,cp_yaw,cp_pitch,cp_static,cp_total"
+
+def calibration_coefficients(ports, Ptotal, Pstatic):
+    """Returns the (N,4) calibration coefficients cp_yaw, cp_pitch, cp_static, cp_total of (N,5) port pressures
+    measured in a flow of known total and static pressure (all in the same units).
+
+    The coefficients use the same definitions as the reduction in FiveHoleProbe_CalibrationAndProcessing, with
+    Pavg the mean of ports 2 to 5:
+        cp_yaw = (P2-P3)/(P1-Pavg), cp_pitch = (P4-P5)/(P1-Pavg),
+        cp_static = (Pavg-Pstatic)/(P1-Pavg), cp_total = (P1-Ptotal)/(P1-Pavg)
+    """
+
+    ports = np.asarray(ports, dtype=float).reshape(-1, 5)
+    P1 = ports[:, 0]
+    Pavg = ports[:, 1:].mean(axis=1)
+    dynamic = P1 - Pavg
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.column_stack([(ports[:, 1] - ports[:, 2])/dynamic, (ports[:, 3] - ports[:, 4])/dynamic,
+                                (Pavg - Pstatic)/dynamic, (P1 - Ptotal)/dynamic])
+
+def run_sweep(rig, yaws, pitches, acquire, calib_filename, points=None, settle=0.0, verbose=True):
+    """Moves **rig** through the calibration points and writes the condensed calibration to **calib_filename**.
+
+    rig: RotateRig (or anything with its moveTo(), dwell(), yaw, pitch and steps per degree).
+    yaws, pitches: Angles in degrees of the calibration grid. Not used if **points** is given.
+    acquire: Called with (yaw, pitch) once the rig has settled. Returns (ports, Ptotal, Pstatic): the five port
+        pressures, either as 5 values or as (N,5) samples that are averaged, and the total and static pressures of
+        the flow (scalars or samples).
+    points: SweepPlan, or (N,2) [yaw,pitch] points in the order to visit them. Defaults to a serpentine plan of
+        the **yaws** x **pitches** grid.
+    settle: Extra seconds to wait at each point before acquiring, beyond the sketch's own settling.
+
+    Returns the rows written, in the csv column order: (N,6), or (N,7) with the pass column.
+    """
+
+    if points is None:
+        points = plan_sweep(yaws, pitches, rig.yawStepsPerDegree, rig.pitchStepsPerDegree,
+                            start=[rig.yaw_steps, rig.pitch_steps])
+    passes = getattr(points, "passes", None)
+    if passes is not None and not passes.any():
+        passes = None
+    points = np.asarray(getattr(points, "points", points), dtype=float).reshape(-1, 2)
+
+    rows = []
+    with open(calib_filename, 'w') as calib_file:
+        calib_file.write(CALIBRATION_HEADER + (",pass\n" if passes is not None else "\n"))
+        for ind, (yaw, pitch) in enumerate(points):
+            rig.moveTo(yaw, pitch)
+            if abs(rig.yaw - yaw) > 0.5/rig.yawStepsPerDegree or abs(rig.pitch - pitch) > 0.5/rig.pitchStepsPerDegree:
+                print("WARNING: Skipping {},{} deg, the rig did not get there.".format(yaw, pitch))
+                continue
+            if settle:
+                rig.dwell(settle)
+
+            ports, Ptotal, Pstatic = acquire(yaw, pitch)
+            ports = np.mean(np.asarray(ports, dtype=float).reshape(-1, 5), axis=0)
+            coefficients = calibration_coefficients(ports, np.mean(Ptotal), np.mean(Pstatic))[0]
+            row = [rig.pitch, rig.yaw] + list(coefficients) + ([passes[ind]] if passes is not None else [])
+            fields = [repr(float(value)) for value in row[:6]] + [str(int(value)) for value in row[6:]]
+            calib_file.write(",".join(fields) + "\n")
+            calib_file.flush()
+            rows.append(row)
+
+            if verbose:
+                print("[{}/{}] yaw {:.2f} pitch {:.2f}: cp_yaw {:.4f} cp_pitch {:.4f}".format(
+                    ind + 1, len(points), rig.yaw, rig.pitch, coefficients[0], coefficients[1]))
+    return np.array(rows).reshape(-1, 6 if passes is None else 7)
+
+def pass_differences(rows):
+    """Returns the largest spread of each coefficient (cp_yaw, cp_pitch, cp_static, cp_total) between the passes
+    over the same (yaw, pitch) point, from the (N,7) rows of a multi-pass sweep. Large spreads point to hysteresis
+    of the rig or drift of the flow."""
+
+    rows = np.asarray(rows, dtype=float)
+    _, point = np.unique(rows[:, :2], axis=0, return_inverse=True)
+    point = point.ravel()
+    spread = np.zeros(4)
+    for col in range(4):
+        values = rows[:, col + 2]
+        high = np.full(point.max() + 1, -np.inf)
+        low = np.full(point.max() + 1, np.inf)
+        np.maximum.at(high, point, values)
+        np.minimum.at(low, point, values)
+        spread[col] = np.max(high - low)
+    return spread
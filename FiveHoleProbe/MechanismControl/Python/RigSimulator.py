@@ -0,0 +1,62 @@
+from SharedSerial import SerialSimulator
+from RotateRig import move_time
+
+class RigSimulator(SerialSimulator):
+    """In-process stand-in for the serial port of RotateRig_Steps.ino, usable as the *transport* of **RotateRig**.
+
+    Reads "yawSteps,pitchSteps" lines like the sketch (at most 20 characters, one line at a time, the next one only
+    after the previous move), steps yaw and then pitch at the sketch's step rate, settles, and answers "ok". The
+    sketch takes the yaw and pitch targets as whole steps from the position it was powered on in.
+
+        clock: SimClock to run on. A new one is created if none given.
+        baudrate: Serial speed used to time the transmission of each line.
+        timeout: Seconds *readline()* blocks before returning b"" when nothing is due, like a serial read timeout.
+        backlash: Steps lost by an axis whenever it reverses, to try hysteresis checks with. *angle_steps* holds
+            the position the probe really reached.
+        acknowledge: False to simulate the original sketch, which sends no "ok".
+    """
+
+    def __init__(self, clock=None, baudrate=9600, timeout=0.5, backlash=0, acknowledge=True):
+
+        super(RigSimulator, self).__init__(clock, baudrate, timeout)
+        self.backlash = backlash
+        self.acknowledge = acknowledge
+
+        self.steps = [0, 0] # Last targets of [yaw,pitch].
+        self.angle_steps = [0, 0] # Where the probe really is, including backlash.
+        self.direction = [0, 0]
+        self.ready = 0.0 # Time the sketch reads its next line.
+
+        self.total_steps = 0
+        self.motion_time = 0.0
+        self.visited = [] # [yawSteps,pitchSteps] targets in the order they were reached.
+
+        self._reply(0.0, "start")
+
+    # Sketch model.
+
+    def _process(self, line, arrival):
+        fields = line[:20].split(",") # The sketch reads at most 20 characters.
+        try:
+            targets = [int(float(fields[0])), int(float(fields[1]))]
+        except (ValueError, IndexError):
+            targets = [0, 0] # atof() of garbage is 0.
+
+        start = max(self.ready, arrival)
+        moves = [target - current for target, current in zip(targets, self.steps)]
+        for axis, move in enumerate(moves):
+            if move == 0:
+                continue
+            direction = 1 if move > 0 else -1
+            lost = self.backlash if self.direction[axis] not in (0, direction) else 0
+            self.angle_steps[axis] += move - direction*min(lost, abs(move))
+            self.direction[axis] = direction
+
+        duration = move_time(*moves)
+        self.ready = start + duration
+        self.steps = targets
+        self.total_steps += sum(abs(move) for move in moves)
+        self.motion_time += duration
+        self.visited.append(list(targets))
+        if self.acknowledge:
+            self._reply(self.ready, "ok")
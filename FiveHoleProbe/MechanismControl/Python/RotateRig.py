@@ -0,0 +1,129 @@
+from serial import Serial
+import time
+
+from SharedSerial import find_port
+
+# Timing of moveToAngle() in RotateRig_Steps.ino. Each axis runs
+#     for(int x = 0; x < delSteps*2.0; x++) { HIGH; delay(10); LOW; delay(10); }
+# so a commanded step is 2 pulses of 2*10 ms, 40 ms, followed by delay(1000) once the move is done.
+STEP_PULSE_TIME = 0.010 # Seconds of each high or low half of a step pulse.
+PULSES_PER_STEP = 2 # The sketch sends two pulses per commanded step.
+SETTLE_TIME = 1.0 # Seconds the sketch waits after every move.
+
+def move_time(yaw_steps, pitch_steps):
+    """Returns the seconds RotateRig_Steps.ino needs to move by **yaw_steps** and **pitch_steps**. The axes move one
+    after the other, then the rig settles."""
+
+    steps = abs(int(yaw_steps)) + abs(int(pitch_steps))
+    return steps*PULSES_PER_STEP*2*STEP_PULSE_TIME + SETTLE_TIME
+
+class RotateRig:
+    """Python driver for the five hole probe calibration rig running RotateRig_Steps.ino.
+
+    Each move is sent as one "yawSteps,pitchSteps" line of absolute step targets, and the driver waits for the
+    sketch's "ok" that follows the move, instead of a fixed delay. Angles are converted to steps with the
+    steps-per-degree of each axis, measured from the position the rig was powered on in (0,0).
+
+        rigName: Serial description of the Arduino, e.g. "Arduino Uno". Required to locate the rig.
+        baudrate: Baud rate of the sketch.
+        yawStepsPerDegree: Commanded steps per degree of yaw.
+        pitchStepsPerDegree: Commanded steps per degree of pitch.
+        limits: Angle limits [[yawMin,yawMax],[pitchMin,pitchMax]] in degrees. Moves outside them are refused.
+        ackMargin: Seconds to wait for an "ok" beyond the expected duration of the move before giving up.
+        legacy: True for sketches that send no "ok". Moves then wait for their expected duration instead.
+        transport: Object to talk to instead of a serial port, e.g. a rig simulator. Must provide write(bytes) and
+            readline() (returning b"" on timeout), and may provide now() and sleep(seconds) to put the rig on its
+            clock. *rigName* and *baudrate* are not used when given.
+    """
+
+    def __init__(self, rigName=None, baudrate=9600, yawStepsPerDegree=1.0, pitchStepsPerDegree=1.0, limits=None,
+                 ackMargin=5.0, legacy=False, transport=None):
+
+        self._now = getattr(transport, "now", time.monotonic)
+        self._sleep = getattr(transport, "sleep", time.sleep)
+        self.yawStepsPerDegree = yawStepsPerDegree
+        self.pitchStepsPerDegree = pitchStepsPerDegree
+        self.limits = limits
+        self.ackMargin = ackMargin
+        self.legacy = legacy
+
+        self.yaw_steps = 0
+        self.pitch_steps = 0
+        self.moves = 0
+        self.move_seconds = 0.0
+
+        if transport is not None:
+            self.port = transport
+        else:
+            port = find_port(rigName)
+            if port is None:
+                raise IOError("Rotation rig could not be found.")
+            print("Rotation rig found on port {}.\n".format(port))
+            self.port = Serial(port, baudrate, timeout=0.5)
+            self._sleep(2) # Board resets when the port opens.
+        self._read_until("start", 3.0)
+
+    @property
+    def yaw(self):
+        return self.yaw_steps/float(self.yawStepsPerDegree)
+
+    @property
+    def pitch(self):
+        return self.pitch_steps/float(self.pitchStepsPerDegree)
+
+    def close(self):
+        self.port.close()
+
+    def _read_until(self, reply, timeout):
+        """Reads lines until one equals **reply**. Returns the other lines read, or None on timeout."""
+
+        deadline = self._now() + timeout
+        lines = []
+        while self._now() < deadline:
+            line = self.port.readline().decode('utf-8', 'replace').strip()
+            if line == reply:
+                return lines
+            if line:
+                lines.append(line)
+        return None
+
+    def moveToSteps(self, yaw_steps, pitch_steps):
+        """Moves the rig to the absolute step targets and returns once it has stopped and settled."""
+
+        yaw_steps = int(round(yaw_steps))
+        pitch_steps = int(round(pitch_steps))
+        expected = move_time(yaw_steps - self.yaw_steps, pitch_steps - self.pitch_steps)
+
+        start = self._now()
+        self.port.write(str.encode("{},{}\n".format(yaw_steps, pitch_steps)))
+        if self.legacy:
+            self._sleep(expected)
+        elif self._read_until("ok", expected + self.ackMargin) is None:
+            raise IOError("Rotation rig did not finish the move to {},{} steps.".format(yaw_steps, pitch_steps))
+
+        self.yaw_steps = yaw_steps
+        self.pitch_steps = pitch_steps
+        self.moves += 1
+        self.move_seconds += self._now() - start
+
+    def moveTo(self, yaw=None, pitch=None):
+        """Moves the rig to **yaw**, **pitch** in degrees. An axis given as None stays where it is."""
+
+        yaw = self.yaw if yaw is None else yaw
+        pitch = self.pitch if pitch is None else pitch
+        if self.limits is not None:
+            (yaw_min, yaw_max), (pitch_min, pitch_max) = self.limits
+            if not (yaw_min <= yaw <= yaw_max and pitch_min <= pitch <= pitch_max):
+                print("Cannot make move. {},{} deg is outside the rig limits.".format(yaw, pitch))
+                return
+        self.moveToSteps(yaw*self.yawStepsPerDegree, pitch*self.pitchStepsPerDegree)
+
+    def dwell(self, seconds):
+        """Waits **seconds** on the rig's clock, e.g. to let the flow settle before sampling."""
+
+        self._sleep(seconds)
+
+    def home(self):
+        """Returns the rig to the position it was powered on in."""
+
+        self.moveToSteps(0, 0)
@@ -0,0 +1,19 @@
+"""Serial helpers the rotation rig shares with the 3D printer driver.
+
+find_port, SimClock and SerialSimulator live with the printer driver in 3DPrinterControl/Python. The two folders are
+run as plain script directories, so this is the one place that puts the printer's folder on the import path. Rig
+modules import the shared helpers from here, in any order.
+"""
+
+import os
+import sys
+
+PRINTER_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..",
+                                             "3DPrinterControl", "Python"))
+if PRINTER_PATH not in sys.path:
+    sys.path.append(PRINTER_PATH)
+
+from Printer import find_port
+from PrinterSimulator import SerialSimulator, SimClock
+
+__all__ = ["find_port", "SerialSimulator", "SimClock"]
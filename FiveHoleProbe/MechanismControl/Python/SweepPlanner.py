@@ -0,0 +1,199 @@
+"""Plans the order of the (yaw, pitch) points of a calibration sweep on the rotation rig.
+
+RotateRig_Steps.ino moves the yaw motor and then the pitch motor at a fixed step rate, so the time of a move grows
+with the sum of the steps of both axes plus a fixed settling time per move. Visiting the grid line by line rewinds
+the whole pitch range for every yaw; the planner instead orders the points serpentine-style or by the smallest total
+step count, optionally over several interleaved or repeated passes to check for drift and hysteresis.
+
+A SweepPlan holds the visiting order both in degrees and in the absolute step targets the sketch takes, with the
+estimated sweep time. CalibrationSweep.run_sweep() takes it as its *points*, and RigSimulator runs it without
+hardware.
+
+    plan = plan_sweep(np.arange(-30, 31, 2), np.arange(-30, 31, 2), yawStepsPerDegree=8.0, pitchStepsPerDegree=8.0)
+    print(plan.summary())
+"""
+
+import argparse
+
+import numpy as np
+
+from RotateRig import PULSES_PER_STEP, SETTLE_TIME, STEP_PULSE_TIME, move_time
+
+ORDERS = ("lines", "serpentine", "min_steps")
+REPEATS = ("same", "reverse")
+
+class SweepPlan:
+    """Visiting order of a calibration sweep.
+
+        points: (N,2) [yaw,pitch] in degrees, in visiting order.
+        steps: (N,2) absolute [yawSteps,pitchSteps] targets sent to the rig.
+        passes: (N,) pass number of every point, from 0.
+        start: [yawSteps,pitchSteps] the rig starts from.
+    """
+
+    def __init__(self, points, steps, passes, start=(0, 0)):
+        self.points = points
+        self.steps = steps
+        self.passes = passes
+        self.start = start
+
+    def __len__(self):
+        return len(self.points)
+
+    def __iter__(self):
+        return iter(self.points)
+
+    def move_steps(self):
+        """Returns the (N,2) steps of every move of each axis, starting from *start*."""
+
+        return np.abs(np.diff(np.vstack([self.start, self.steps]), axis=0))
+
+    @property
+    def total_steps(self):
+        return int(self.move_steps().sum())
+
+    @property
+    def stepping_time(self):
+        """Seconds spent stepping the motors, which the visiting order changes."""
+
+        return self.total_steps*PULSES_PER_STEP*2*STEP_PULSE_TIME
+
+    @property
+    def settling_time(self):
+        """Seconds spent settling after every move, the same for any order of the same points."""
+
+        return len(self)*SETTLE_TIME
+
+    @property
+    def estimated_time(self):
+        """Seconds the sweep needs on RotateRig_Steps.ino (see RotateRig.move_time()), excluding acquisition at each
+        point."""
+
+        return float(sum(move_time(yaw, pitch) for yaw, pitch in self.move_steps()))
+
+    def summary(self):
+        return "{} points in {} passes, {} steps, about {:.1f} min ({:.1f} min stepping, {:.1f} min settling)".format(
+            len(self), int(self.passes.max()) + 1 if len(self) else 0, self.total_steps, self.estimated_time/60.0,
+            self.stepping_time/60.0, self.settling_time/60.0)
+
+    def write_targets(self, filename):
+        """Writes the step targets as "yawSteps,pitchSteps" lines, the format the sketch reads, e.g. to stream them
+        from another program."""
+
+        np.savetxt(filename, self.steps, fmt='%d', delimiter=',')
+
+def _cost(steps, order, start):
+    return np.abs(np.diff(np.vstack([start, steps[order]]), axis=0)).sum()
+
+def _lines(steps, outer, reverse_inner):
+    """Returns the order visiting **steps** line by line along axis **outer**, reversing every other line if
+    **reverse_inner**."""
+
+    inner = 1 - outer
+    line = np.unique(steps[:, outer], return_inverse=True)[1].ravel()
+    direction = np.where(line % 2 == 0, 1, -1) if reverse_inner else 1
+    return np.lexsort((direction*steps[:, inner], line))
+
+def _serpentine(steps, start):
+    """Returns the cheapest serpentine order over both outer axes and all four starting corners."""
+
+    orders = []
+    for outer in (0, 1):
+        order = _lines(steps, outer, True)
+        orders.extend([order, order[::-1]])
+        flipped = _lines(steps*np.where(np.arange(2) == 1 - outer, -1, 1), outer, True)
+        orders.extend([flipped, flipped[::-1]])
+    return min(orders, key=lambda order: _cost(steps, order, start))
+
+def _nearest(steps, start):
+    """Returns the order always moving to the unvisited point with the fewest steps away."""
+
+    remaining = np.ones(len(steps), dtype=bool)
+    order = np.empty(len(steps), dtype=np.int64)
+    current = np.asarray(start)
+    for ind in range(len(steps)):
+        ids = np.flatnonzero(remaining)
+        choice = ids[np.argmin(np.abs(steps[ids] - current).sum(axis=1))]
+        order[ind] = choice
+        remaining[choice] = False
+        current = steps[choice]
+    return order
+
+def order_points(steps, order="serpentine", start=(0, 0)):
+    """Returns the indices visiting the (N,2) **steps** targets.
+
+    order: "lines" visits yaw line by line, rewinding pitch each time (the LabVIEW order). "serpentine" sweeps pitch
+        back and forth, along whichever axis and from whichever corner takes the fewest steps. "min_steps" also
+        tries a nearest-neighbour order, which helps for irregular point sets, and keeps the cheapest.
+    """
+
+    steps = np.asarray(steps).reshape(-1, 2)
+    if len(steps) == 0:
+        return np.empty(0, dtype=np.int64)
+    if order == "lines":
+        return _lines(steps, 0, False)
+    if order == "serpentine":
+        return _serpentine(steps, start)
+    if order == "min_steps":
+        return min([_serpentine(steps, start), _nearest(steps, start)], key=lambda ids: _cost(steps, ids, start))
+    raise ValueError("Unknown sweep order: {}".format(order))
+
+def plan_sweep(yaws=None, pitches=None, yawStepsPerDegree=1.0, pitchStepsPerDegree=1.0, order="serpentine",
+               passes=1, repeat="reverse", interleave=1, points=None, start=(0, 0)):
+    """Plans a calibration sweep. Returns a SweepPlan.
+
+    yaws, pitches: Angles in degrees of the calibration grid.
+    yawStepsPerDegree, pitchStepsPerDegree: As RotateRig, to convert to step targets and estimate times.
+    order: See *order_points()*.
+    passes: Number of times every point is visited. Repeated readings of a point are averaged by CalibData and
+        their spread shows hysteresis and drift (see CalibrationSweep.pass_differences()).
+    repeat: "same" repeats the first pass in the same order, so each point is approached the same way; "reverse"
+        runs every other pass backwards, so each point is also approached from the other direction.
+    interleave: Splits every pass into this many sub-sweeps over every interleave-th yaw line, so slow drift of the
+        flow is spread over the whole grid instead of growing across it.
+    points: (N,2) [yaw,pitch] points in degrees to plan instead of the **yaws** x **pitches** grid.
+    start: [yawSteps,pitchSteps] the rig starts from.
+    """
+
+    if repeat not in REPEATS:
+        raise ValueError("Unknown repeat: {}".format(repeat))
+    if points is None:
+        yaw, pitch = np.meshgrid(np.asarray(yaws, dtype=float), np.asarray(pitches, dtype=float), indexing='ij')
+        points = np.column_stack([yaw.ravel(), pitch.ravel()])
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    steps = np.rint(points*[yawStepsPerDegree, pitchStepsPerDegree]).astype(np.int64)
+
+    line = np.unique(steps[:, 0], return_inverse=True)[1].ravel()
+    groups = [np.flatnonzero(line % interleave == group) for group in range(interleave)]
+
+    first = []
+    position = np.asarray(start)
+    for group in groups:
+        ids = group[order_points(steps[group], order, position)]
+        first.append(ids)
+        if len(ids):
+            position = steps[ids[-1]]
+    first = np.concatenate(first)
+    ordered = [first[::-1] if repeat == "reverse" and sweep % 2 == 1 else first for sweep in range(passes)]
+
+    order_ids = np.concatenate(ordered) if ordered else np.empty(0, dtype=np.int64)
+    pass_ids = np.repeat(np.arange(passes), len(points))
+    return SweepPlan(points[order_ids], steps[order_ids], pass_ids, np.asarray(start))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare calibration sweep orders on the rotation rig.")
+    parser.add_argument("--range", type=float, default=30.0, help="Yaw and pitch span -range to range degrees.")
+    parser.add_argument("--step", type=float, default=2.0, help="Grid step in degrees.")
+    parser.add_argument("--steps-per-degree", type=float, nargs=2, default=[1.0, 1.0], metavar=("YAW", "PITCH"))
+    parser.add_argument("--passes", type=int, default=1)
+    parser.add_argument("--interleave", type=int, default=1)
+    parser.add_argument("--targets", help="Write the step targets of the fastest plan to this file.")
+    args = parser.parse_args()
+
+    angles = np.arange(-args.range, args.range + args.step/2, args.step)
+    plans = {order: plan_sweep(angles, angles, *args.steps_per_degree, order=order, passes=args.passes,
+                               interleave=args.interleave) for order in ORDERS}
+    for order, plan in plans.items():
+        print("{:>10}: {}".format(order, plan.summary()))
+    if args.targets:
+        min(plans.values(), key=lambda plan: plan.estimated_time).write_targets(args.targets)